@@ -1,13 +1,42 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, abort, jsonify
+from flask import Flask, Response, get_template_attribute, render_template, redirect, url_for, flash, request, abort, jsonify, stream_with_context
 from config import Config
-from models import db, User, Doctor, Appointment, Feedback, UserRole
-from forms import RegisterForm, LoginForm, DoctorForm, AppointmentForm, DoctorRegisterForm, ProfileForm, SearchForm, RescheduleForm, InquiryForm
+from models import db, User, Doctor, Appointment, ArchivedAppointment, Feedback, UserRole, VISIT_MODES
+from forms import RegisterForm, LoginForm, DoctorForm, AppointmentForm, DoctorRegisterForm, ProfileForm, SearchForm, RescheduleForm, InquiryForm, FeedbackForm
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import datetime
+from datetime import datetime, timedelta
+from functools import wraps
+import time
+from sqlalchemy import func, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException
 from flask_migrate import Migrate
-from logger import setup_logger
-import json
+from flask_mail import Mail
+from jinja2 import FileSystemBytecodeCache
+from logger import setup_logger, init_request_logging
+from routing import init_routing, replicas, use_primary
+from metrics import init_metrics, registry
+from pagination import Page, paginate, page_size, pager_url, wants_json
+from cache import FragmentCache, TTLCache
+from httpcache import conditional, last_modified, page_etag, shareable
+from hashing import PasswordHasher, HasherBusy
+from identity import load_snapshot
+from search_index import DoctorSearchIndex
+from availability import AvailabilityEngine
+from occupancy import OccupancyMatrix
+from ratings import add_feedback, change_feedback, remove_feedback, recompute_ratings
+from importer import DoctorImporter
+from export import EXPORT_FORMATS, export_appointments
+from outbox import MailWorker, notify_appointment, outbox_counts
+from archive import archive_appointments, has_visited, history
+from rollups import rebuild_rollups, summary as rollup_summary, watch as watch_rollups
+from changefeed import ChangeFeed, FeedFull, record_change, format_sse, prune as prune_changes
+from bulk import approve_doctors, delete_doctors, delete_users, doctor_selection, user_selection, count_matching
+from slots import SlotTaken, reserve_slot, move_slot, release_slot
+import os
+import socket
+import click
 
 #admin details
 # VALUES ('admin123', 'admin@example.com', 'pbkdf2:sha256:260000$TBTR0D4A0gvuaXHG$4fec38cacae6d2ceba7b49216c85af43c5670c8a0f2798b108b704c83c5c6d7a', '1234567890', 1)
@@ -17,26 +46,138 @@ app = Flask(__name__)
 app.config.from_object(Config)
 
 db.init_app(app)
+init_routing(app, db)
 migrate = Migrate(app, db)
 
 # Set up logger
-logger = setup_logger()
+logger = setup_logger(app.config)
+init_request_logging(app, logger)
+init_metrics(app, db, logger)
 
-# Set up mail (commented out as email system removed)
-# mail = Mail(app)
+# Mail is never sent from a request: routes queue it in the outbox within their
+# transaction and the `flask send-mail` worker delivers it
+mail = Mail(app)
+
+# Compiled templates persist across restarts, so new workers skip compilation
+os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
+app.add_template_global(pager_url)
+
+# Doctor directory pages are cached as plain dicts; every route that changes
+# the directory calls directory.invalidate() after committing
+directory = TTLCache(maxsize=app.config['DIRECTORY_CACHE_SIZE'], ttl=app.config['DIRECTORY_CACHE_TTL'])
+doctor_index = DoctorSearchIndex(max_age=app.config['SEARCH_INDEX_MAX_AGE'])
+# Rendered doctor cards, keyed by the doctor's stamp; directory_changed() bumps it
+fragments = FragmentCache(maxsize=app.config['FRAGMENT_CACHE_SIZE'], ttl=app.config['DIRECTORY_CACHE_TTL'])
+
+@app.template_global()
+def doctor_card(doc):
+    """Render a directory card through the fragment cache."""
+    viewer = current_user.role if current_user.is_authenticated else None
+    key = ('doctor_card', doc['id'], fragments.stamp(doc['id']), viewer, doc.get('free_at'))
+    return fragments.get_or_load(key, lambda: get_template_attribute('_doctor_card.html', 'doctor_card')(
+        doc, current_user))
+
+def directory_changed(upserted=None, removed=None, reindex=False):
+    """Propagate a committed doctor write to the in-process read paths."""
+    directory.invalidate()
+    occupancy.invalidate()
+    if upserted is not None:
+        fragments.bump(upserted.id)
+    elif removed is not None:
+        fragments.bump(removed)
+    else:
+        fragments.invalidate()
+    if reindex:
+        doctor_index.invalidate()
+    if upserted is not None:
+        doctor_index.upsert(upserted)
+    if removed is not None:
+        doctor_index.remove(removed)
+
+def rating_changed(doc_id):
+    # Ratings move often; refresh the doctor in place instead of rebuilding the matrix
+    directory.invalidate()
+    fragments.bump(doc_id)
+    doc = Doctor.query.get(doc_id)
+    if doc is not None:
+        doctor_index.upsert(doc)
+        occupancy.set_rating(doc.id, doc.rating)
+
+availability = AvailabilityEngine(slot_minutes=app.config['SLOT_MINUTES'],
+                                  default_spec=app.config['DEFAULT_AVAILABILITY'],
+                                  horizon_days=app.config['AVAILABILITY_HORIZON_DAYS'],
+                                  timezone=app.config['CLINIC_TIMEZONE'])
+occupancy = OccupancyMatrix(availability, window_days=app.config['OCCUPANCY_WINDOW_DAYS'],
+                            max_age=app.config['OCCUPANCY_MAX_AGE'])
+occupancy.watch()
+
+# Appointment changes are appended to appointment_events by the routes below and
+# pushed to open dashboards over SSE (see appointment_events())
+changes = ChangeFeed(app, poll_interval=app.config['CHANGE_FEED_POLL_SECONDS'],
+                     max_subscribers=app.config['CHANGE_FEED_MAX_SUBSCRIBERS'],
+                     buffer_size=app.config['CHANGE_FEED_BUFFER'])
+changes.watch()
+
+# appointment_rollups follow every ORM write to appointments (see rollups.py)
+watch_rollups()
+
+# pbkdf2 runs on a bounded process pool so login bursts cannot pin every request thread
+hasher = PasswordHasher(workers=app.config['HASH_WORKERS'], max_pending=app.config['HASH_MAX_PENDING'],
+                        timeout=app.config['HASH_TIMEOUT'])
+
+registry.gauge('app_cache_entries', 'Entries held by in-process caches.', ('cache',),
+               lambda: {('directory',): directory.stats()['size'], ('identities',): identities.stats()['size'],
+                        ('fragments',): fragments.stats()['size']})
+registry.gauge('app_cache_hits', 'Cache hits since start.', ('cache',),
+               lambda: {('directory',): directory.hits, ('identities',): identities.hits,
+                        ('fragments',): fragments.hits})
+registry.gauge('app_cache_misses', 'Cache misses since start.', ('cache',),
+               lambda: {('directory',): directory.misses, ('identities',): identities.misses,
+                        ('fragments',): fragments.misses})
+registry.gauge('change_feed_subscribers', 'Open live-update (SSE) connections.', (),
+               lambda: {(): changes.stats()['subscribers']})
+registry.gauge('password_hash_jobs', 'Password hashing jobs by state.', ('state',),
+               lambda: {(key,): value for key, value in hasher.stats().items()
+                        if key in ('pending', 'calls', 'rejected', 'timeouts')})
 
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+# current_user is a cached UserSnapshot; routes that change a user or their
+# doctor profile must call identities.delete(user_id) after committing
+identities = TTLCache(maxsize=app.config['IDENTITY_CACHE_SIZE'], ttl=app.config['IDENTITY_CACHE_TTL'])
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+        # Writes act as the account: re-read it, since another worker may have
+        # deleted or demoted it and only dropped its own cached snapshot
+        identities.delete(user_id)
+    return identities.get_or_load(user_id, lambda: load_snapshot(user_id))
+
+def forget_identities(user_ids):
+    for user_id in user_ids:
+        identities.delete(user_id)
 
 # --- Public pages ---
 @app.route('/')
 def index():
-    docs = Doctor.query.order_by(Doctor.created_at.desc()).all()
-    return render_template('index.html', doctors=docs)
+    # Anonymous hits are validated from the cached page data before rendering
+    docs = directory_page()
+    etag = page_etag('index', docs, wants_json()) if shareable() else None
+    if wants_json():
+        return conditional(lambda: jsonify(docs), etag)
+    return conditional(lambda: render_template('index.html', doctors=Page.from_dict(docs)), etag)
+
+def directory_page():
+    # ?visit_mode=online|clinic narrows the listing in SQL (see Doctor.offers)
+    visit = VISIT_MODES.get(request.args.get('visit_mode'))
+    key = ('index', request.args.get('after'), request.args.get('before'), page_size(), visit)
+    query = Doctor.query.filter(Doctor.offers(visit)) if visit else Doctor.query
+    return directory.get_or_load(key, lambda: paginate(
+        query, [Doctor.created_at, Doctor.id], descending=True).to_dict(Doctor.to_dict))
 
 @app.route('/chatbot')
 def chatbot():
@@ -44,7 +185,7 @@ def chatbot():
 
 @app.route('/welcome')
 def welcome():
-    logger.info(f"Request received: {request.method} {request.path}")
+    logger.info('Request received: %s %s', request.method, request.path)
     return jsonify({'message': 'Welcome to the Clinic Management System!'})
 
 # --- User registration & login ---
@@ -59,7 +200,7 @@ def register():
         elif User.query.filter_by(email=form.email.data).first():
             flash('Email already registered', 'danger')
         else:
-            hashed = generate_password_hash(form.password.data)
+            hashed = hasher.generate(form.password.data)
             role = UserRole.ADMIN if form.username.data == 'admin123' else UserRole(form.role.data)
             user = User(username=form.username.data, email=form.email.data,
                         password_hash=hashed, contact=form.contact.data, role=role)
@@ -80,13 +221,12 @@ def doctor_register():
         elif User.query.filter_by(email=form.email.data).first():
             flash('Email already registered', 'danger')
         else:
-            hashed = generate_password_hash(form.password.data)
+            hashed = hasher.generate(form.password.data)
             user = User(username=form.username.data, email=form.email.data,
                         password_hash=hashed, contact=form.contact.data, role=UserRole.DOCTOR)
             db.session.add(user)
             db.session.commit()
             # Create doctor profile
-            visit_types = json.dumps([form.visit_types.data]) if form.visit_types.data != 'both' else json.dumps(['clinic', 'online'])
             doc = Doctor(
                 user_id=user.id,
                 name=form.name.data,
@@ -96,11 +236,12 @@ def doctor_register():
                 fees=form.fees.data or 0.0,
                 location=form.location.data,
                 contact_info=form.contact_info.data,
-                visit_types=visit_types,
+                visit_mask=VISIT_MODES[form.visit_types.data],
                 verified=False
             )
             db.session.add(doc)
             db.session.commit()
+            directory_changed(upserted=doc)
             flash('Doctor registration submitted. Awaiting admin approval.', 'success')
             return redirect(url_for('login'))
     return render_template('doctor_register.html', form=form)
@@ -112,7 +253,7 @@ def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
-        if user and check_password_hash(user.password_hash, form.password.data):
+        if user and hasher.check(user.password_hash, form.password.data):
             login_user(user)
             flash('Logged in successfully', 'success')
             next_page = request.args.get('next') or url_for('index')
@@ -130,11 +271,14 @@ def logout():
 
 # --- Admin panel (doctor management) ---
 def admin_required(func):
-    from functools import wraps
     @wraps(func)
     def decorated(*args, **kwargs):
         if not current_user.is_authenticated or not current_user.is_admin:
             abort(403)
+        # The cached snapshot may predate a demotion made in another worker
+        if db.session.scalar(select(User.role).where(User.id == current_user.id)) != UserRole.ADMIN:
+            identities.delete(current_user.id)
+            abort(403)
         return func(*args, **kwargs)
     return decorated
 
@@ -142,11 +286,17 @@ def admin_required(func):
 @login_required
 @admin_required
 def admin_panel():
-    doctors = Doctor.query.order_by(Doctor.created_at.desc()).all()
-    users = User.query.order_by(User.id).all()
+    return render_admin_panel()
+
+def render_admin_panel(**context):
+    # Doctors and users page independently ('d_' / 'u_' cursor prefixes)
+    doctors = paginate(Doctor.query, [Doctor.created_at, Doctor.id], descending=True, prefix='d_')
+    users = paginate(User.query, [User.id], prefix='u_')
+    if wants_json():
+        return jsonify({'doctors': doctors.to_dict(Doctor.to_dict), 'users': users.to_dict(User.to_dict)})
     return render_template('admin_panel.html', doctors=doctors, users=users,
                            admin_email=app.config['ADMIN_EMAIL'],
-                           admin_contact=app.config['ADMIN_CONTACT'])
+                           admin_contact=app.config['ADMIN_CONTACT'], **context)
 
 @app.route('/admin/add_doctor', methods=['GET','POST'])
 @login_required
@@ -154,7 +304,6 @@ def admin_panel():
 def add_doctor():
     form = DoctorForm()
     if form.validate_on_submit():
-        visit_types = json.dumps([form.visit_types.data]) if form.visit_types.data != 'both' else json.dumps(['clinic', 'online'])
         doc = Doctor(
             name=form.name.data,
             degree=form.degree.data,
@@ -163,11 +312,12 @@ def add_doctor():
             fees=form.fees.data or 0.0,
             location=form.location.data,
             contact_info=form.contact_info.data,
-            visit_types=visit_types,
+            visit_mask=VISIT_MODES[form.visit_types.data],
             verified=True
         )
         db.session.add(doc)
         db.session.commit()
+        directory_changed(upserted=doc)
         flash('Doctor added', 'success')
         return redirect(url_for('admin_panel'))
     return render_template('add_doctor.html', form=form)
@@ -178,15 +328,93 @@ def add_doctor():
 def approve_doctor(user_id):
     user = User.query.get_or_404(user_id)
     if user.role == UserRole.DOCTOR and hasattr(user, 'doctor_profile') and user.doctor_profile:
-        user.doctor_profile.verified = True
-        db.session.commit()
-        flash(f'Doctor {user.doctor_profile.name} approved.', 'success')
+        doc = user.doctor_profile
+        approve_doctors([Doctor.id == doc.id])
+        identities.delete(user.id)
+        db.session.refresh(doc)
+        directory_changed(upserted=doc)
+        flash(f'Doctor {doc.name} approved.', 'success')
     return redirect(url_for('admin_panel'))
 
 @app.route('/doctor/<int:doc_id>')
 def doctor_profile(doc_id):
+    doc = directory.get_or_load(('doctor', doc_id), lambda: load_doctor(doc_id))
+    if doc is None:
+        abort(404)
+    if shareable():
+        return conditional(lambda: render_template('doctor_profile.html', doc=doc, feedback_form=None),
+                           page_etag('doctor', {'items': [doc], 'next': None, 'prev': None}),
+                           last_modified(doc))
+    feedback_form = FeedbackForm() if current_user.is_authenticated and current_user.role == UserRole.PATIENT else None
+    return conditional(lambda: render_template('doctor_profile.html', doc=doc, feedback_form=feedback_form))
+
+def load_doctor(doc_id):
+    doc = Doctor.query.get(doc_id)
+    return doc.to_dict() if doc else None
+
+@app.route('/feedback/<int:doc_id>', methods=['POST'])
+@login_required
+def submit_feedback(doc_id):
+    if current_user.role != UserRole.PATIENT:
+        abort(403)
     doc = Doctor.query.get_or_404(doc_id)
-    return render_template('doctor_profile.html', doc=doc)
+    form = FeedbackForm()
+    if not form.validate_on_submit():
+        flash('Please choose a rating between 1 and 5.', 'danger')
+        return redirect(url_for('doctor_profile', doc_id=doc.id))
+    if not has_visited(current_user.id, doc.id):
+        flash('You can rate a doctor once you have an appointment with them.', 'warning')
+        return redirect(url_for('doctor_profile', doc_id=doc.id))
+    feedback = Feedback.query.filter_by(user_id=current_user.id, doctor_id=doc.id).first()
+    if feedback is None:
+        try:
+            add_feedback(Feedback(user_id=current_user.id, doctor_id=doc.id,
+                                  rating=form.rating.data, comment=form.comment.data))
+        except IntegrityError:
+            # A concurrent submit from this patient inserted it first
+            feedback = Feedback.query.filter_by(user_id=current_user.id, doctor_id=doc.id).one()
+    if feedback is not None:
+        change_feedback(feedback, form.rating.data)
+        feedback.comment = form.comment.data
+    db.session.commit()
+    rating_changed(doc.id)
+    flash('Thank you for your feedback.', 'success')
+    return redirect(url_for('doctor_profile', doc_id=doc.id))
+
+@app.route('/feedback/<int:feedback_id>/delete', methods=['POST'])
+@login_required
+def delete_feedback(feedback_id):
+    feedback = Feedback.query.filter_by(id=feedback_id).with_for_update().first_or_404()
+    if feedback.user_id != current_user.id and not current_user.is_admin:
+        abort(403)
+    doc_id = feedback.doctor_id
+    remove_feedback(feedback)
+    db.session.commit()
+    rating_changed(doc_id)
+    flash('Feedback removed.', 'info')
+    return redirect(url_for('doctor_profile', doc_id=doc_id))
+
+@app.route('/doctor/<int:doc_id>/availability')
+@app.route('/api/v1/doctors/<int:doc_id>/availability')
+def doctor_availability(doc_id):
+    # ?date=YYYY-MM-DD lists that day's free slots, otherwise the next ?next=N
+    doc = db.session.query(Doctor.id, Doctor.availability).filter(Doctor.id == doc_id).first()
+    if doc is None:
+        abort(404)
+    date_str = request.args.get('date')
+    if date_str:
+        try:
+            day = datetime.strptime(date_str, '%Y-%m-%d').date()
+        except ValueError:
+            return jsonify({'error': 'date must be YYYY-MM-DD'}), 400
+        slots = availability.free_slots(doc, day)
+        return jsonify({'doctor_id': doc_id, 'date': day.isoformat(),
+                        'slot_minutes': availability.slot_minutes,
+                        'slots': [{'date': day.isoformat(), 'time': t.strftime('%H:%M')} for t in slots]})
+    count = max(1, min(request.args.get('next', 10, type=int), 100))
+    slots = availability.next_free_slots(doc, count)
+    return jsonify({'doctor_id': doc_id, 'slot_minutes': availability.slot_minutes,
+                    'slots': [{'date': s.date().isoformat(), 'time': s.strftime('%H:%M')} for s in slots]})
 
 # --- Appointment booking (only for logged-in users) ---
 @app.route('/book/<int:doc_id>', methods=['GET','POST'])
@@ -201,28 +429,28 @@ def book(doc_id):
         return redirect(url_for('index'))
     form = AppointmentForm()
     if form.validate_on_submit():
-        # Basic availability check (no duplicate for same doctor at same date+time)
-        existing = Appointment.query.filter(
-    Appointment.doctor_id == doc.id,
-    Appointment.date == form.date.data,
-    Appointment.time == form.time.data,
-    Appointment.status != 'cancelled'
-).first()
-
-        if existing:
+        if not availability.is_open(doc, form.date.data, form.time.data):
+            flash('The doctor is not available at that time. Please pick one of the free slots.', 'warning')
+            return render_template('book_appoinment.html', doctor=doc, form=form)
+        appt = Appointment(
+            doctor_id=doc.id,
+            patient_id=current_user.id,
+            date=form.date.data,
+            time=form.time.data,
+            visit_type=form.visit_type.data,
+            notes=form.notes.data,
+            status='pending'
+        )
+        # The slot reservation's unique key rejects double bookings atomically
+        try:
+            reserve_slot(appt)
+            record_change(appt, 'booked')
+            notify_appointment(appt, 'booked')
+            db.session.commit()
+        except SlotTaken:
+            db.session.rollback()
             flash('This slot is already taken. Choose another time.', 'warning')
         else:
-            appt = Appointment(
-                doctor_id=doc.id,
-                patient_id=current_user.id,
-                date=form.date.data,
-                time=form.time.data,
-                visit_type=form.visit_type.data,
-                notes=form.notes.data,
-                status='pending'
-            )
-            db.session.add(appt)
-            db.session.commit()
             flash('Appointment requested. You can view in My Appointments.', 'success')
             return redirect(url_for('my_appointments'))
     return render_template('book_appoinment.html', doctor=doc, form=form)
@@ -233,11 +461,18 @@ def my_appointments():
     if current_user.is_admin:
         flash('Admins cannot view personal appointments. Please manage doctors from the admin panel.', 'warning')
         return redirect(url_for('admin_panel'))
-    appts = Appointment.query.filter_by(patient_id=current_user.id).order_by(Appointment.date, Appointment.time).all()
-    return render_template('my_appointments.html', appointments=appts)
+    appts = (Appointment.query.options(joinedload(Appointment.doctor))
+             .filter_by(patient_id=current_user.id)
+             .order_by(Appointment.date, Appointment.time).all())
+    # Older history lives in the archive tier; merge it in read-only
+    past = (ArchivedAppointment.query.filter_by(patient_id=current_user.id)
+            .order_by(ArchivedAppointment.date, ArchivedAppointment.time).all())
+    appts = sorted(past + appts, key=lambda a: (a.date, a.time))
+    return render_template('my_appointments.html', appointments=appts, feed_head=changes.head())
 
 @app.route('/cancel/<int:appt_id>')
 @login_required
+@use_primary
 def cancel_appointment(appt_id):
     if current_user.is_admin:
         abort(403)
@@ -245,6 +480,8 @@ def cancel_appointment(appt_id):
     if appt.patient_id != current_user.id:
         abort(403)
     appt.status = 'cancelled'
+    release_slot(appt)
+    record_change(appt, 'cancelled')
     db.session.commit()
     flash('Appointment cancelled', 'info')
     return redirect(url_for('my_appointments'))
@@ -260,22 +497,21 @@ def reschedule(appt_id):
         return redirect(url_for('my_appointments'))
     form = RescheduleForm()
     if form.validate_on_submit():
-        # Check availability
-        existing = Appointment.query.filter(
-            Appointment.doctor_id == appt.doctor_id,
-            Appointment.date == form.date.data,
-            Appointment.time == form.time.data,
-            Appointment.status != 'cancelled',
-            Appointment.id != appt_id
-        ).first()
-        if existing:
+        if not availability.is_open(appt.doctor, form.date.data, form.time.data):
+            flash('The doctor is not available at that time. Please pick one of the free slots.', 'warning')
+            return render_template('reschedule.html', form=form, appointment=appt)
+        try:
+            move_slot(appt, form.date.data, form.time.data)
+        except SlotTaken:
+            db.session.rollback()
             flash('This slot is already taken. Choose another time.', 'warning')
         else:
-            appt.date = form.date.data
-            appt.time = form.time.data
             appt.notes = form.notes.data
             appt.reschedule_count += 1
             appt.status = 'pending'  # Reset to pending
+            appt.doctor_response = None  # The doctor answers the new time afresh
+            record_change(appt, 'rescheduled')
+            notify_appointment(appt, 'rescheduled')
             db.session.commit()
             flash('Appointment rescheduled.', 'success')
             return redirect(url_for('my_appointments'))
@@ -284,35 +520,77 @@ def reschedule(appt_id):
 @app.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
+    user = User.query.get_or_404(current_user.id)
     form = ProfileForm()
     if form.validate_on_submit():
-        current_user.address = form.address.data
-        current_user.city = form.city.data
-        current_user.dob = form.dob.data
+        user.address = form.address.data
+        user.city = form.city.data
+        user.dob = form.dob.data
         db.session.commit()
+        identities.delete(user.id)
         flash('Profile updated.', 'success')
         return redirect(url_for('profile'))
-    form.address.data = current_user.address
-    form.city.data = current_user.city
-    form.dob.data = current_user.dob
+    form.address.data = user.address
+    form.city.data = user.city
+    form.dob.data = user.dob
     return render_template('profile.html', form=form)
 
 @app.route('/search', methods=['GET', 'POST'])
 def search():
-    form = SearchForm()
-    doctors = []
-    if form.validate_on_submit():
-        query = Doctor.query.filter_by(verified=True)
-        if form.specialization.data:
-            query = query.filter(Doctor.specialization.ilike(f'%{form.specialization.data}%'))
-        if form.city.data:
-            query = query.filter(Doctor.location.ilike(f'%{form.city.data}%'))
-        if form.min_fees.data:
-            query = query.filter(Doctor.fees <= form.min_fees.data)
-        if form.min_rating.data:
-            query = query.filter(Doctor.rating >= form.min_rating.data)
-        doctors = query.all()
-    return render_template('search_results.html', form=form, doctors=doctors)
+    # The home page submits the search as GET, and cursors ride in the query string
+    form = SearchForm(request.values, meta={'csrf': False})
+    doctors = None
+    if form.validate():
+        try:
+            doctors, total = search_doctors(form)
+        except ValueError as e:
+            form.date.errors.append(str(e))
+    if doctors is None:
+        if wants_json():
+            return jsonify({'errors': form.errors}), 400
+        return render_template('search_results.html', form=form, doctors=[], total=0)
+    etag = page_etag('search', doctors.to_dict(dict), total, wants_json()) if shareable() else None
+    if wants_json():
+        return conditional(lambda: jsonify(dict(doctors.to_dict(dict), total=total)), etag)
+    return conditional(lambda: render_template('search_results.html', form=form, doctors=doctors, total=total), etag)
+
+def search_doctors(form):
+    """Run a validated SearchForm and return (Page, total).
+
+    Ranked results come from the in-memory index and cursors are result
+    offsets. Raises ValueError when the date is outside the occupancy window.
+    """
+    doctor_index.ensure_fresh()
+    visit = VISIT_MODES.get(form.visit_mode.data)
+    per_page = page_size()
+    offset = max(request.args.get('after', type=int) or request.args.get('before', type=int) or 0, 0)
+    if form.date.data:
+        records, total = search_free(form, visit, per_page, offset)
+    else:
+        records, total = doctor_index.search(q=form.q.data, specialization=form.specialization.data,
+                                             city=form.city.data, max_fees=form.min_fees.data or None,
+                                             min_rating=form.min_rating.data or None, visit=visit,
+                                             limit=per_page, offset=offset)
+    doctors = Page(records,
+                   next_cursor=str(offset + per_page) if offset + per_page < total else None,
+                   prev_cursor=str(max(offset - per_page, 0)) if offset else None)
+    return doctors, total
+
+def search_free(form, visit, per_page, offset):
+    # Who is free on date (at time) is answered by the occupancy matrix;
+    # keywords, if any, narrow it through the text index
+    ids = None
+    if form.q.data:
+        matches, _ = doctor_index.search(q=form.q.data, limit=len(doctor_index.records))
+        ids = [r['id'] for r in matches]
+    free, total = occupancy.free_doctors(form.date.data, form.time.data,
+                                         specialization=form.specialization.data, city=form.city.data,
+                                         max_fees=form.min_fees.data or None,
+                                         min_rating=form.min_rating.data or None, visit=visit,
+                                         ids=ids, limit=per_page, offset=offset)
+    records = [dict(doctor_index.get(doc_id), free_at=when.strftime('%Y-%m-%d %H:%M'))
+               for doc_id, when in free if doctor_index.get(doc_id)]
+    return records, total
 
 @app.route('/contact/<int:doc_id>', methods=['GET', 'POST'])
 @login_required
@@ -327,10 +605,20 @@ def contact(doc_id):
 @app.route('/doctor_dashboard')
 @login_required
 def doctor_dashboard():
-    if current_user.role != UserRole.DOCTOR or not hasattr(current_user, 'doctor_profile') or not current_user.doctor_profile.verified:
+    if current_user.role != UserRole.DOCTOR or not current_user.doctor_profile or not current_user.doctor_profile.verified:
         abort(403)
-    appts = Appointment.query.filter_by(doctor_id=current_user.doctor_profile.id).order_by(Appointment.date, Appointment.time).all()
-    return render_template('doctor_dashboard.html', appointments=appts)
+    appts = (Appointment.query.options(joinedload(Appointment.patient))
+             .filter_by(doctor_id=current_user.doctor_profile.id)
+             .order_by(Appointment.date, Appointment.time).all())
+    # Partition the single result set rather than issuing one query per section
+    today = availability.now().date()
+    return render_template('doctor_dashboard.html', appointments=appts,
+                           pending_appts=[a for a in appts if a.status == 'pending'],
+                           confirmed_appts=[a for a in appts if a.status == 'confirmed'],
+                           today_appts=[a for a in appts if a.date == today],
+                           total_appts=appts, feed_head=changes.head(),
+                           archived_count=db.session.scalar(
+                               select(func.count()).where(ArchivedAppointment.doctor_id == current_user.doctor_profile.id)))
 
 @app.route('/accept_appointment/<int:appt_id>', methods=['POST'])
 @login_required
@@ -340,8 +628,18 @@ def accept_appointment(appt_id):
     appt = Appointment.query.get_or_404(appt_id)
     if appt.doctor_id != current_user.doctor_profile.id:
         abort(403)
+    try:
+        # Re-claim the slot if the appointment had been released
+        if appt.reservation is None:
+            move_slot(appt, appt.date, appt.time)
+    except SlotTaken:
+        db.session.rollback()
+        flash('This slot has been booked by another patient.', 'warning')
+        return redirect(url_for('doctor_dashboard'))
     appt.status = 'confirmed'
     appt.doctor_response = 'accept'
+    record_change(appt, 'accepted')
+    notify_appointment(appt, 'accepted')
     db.session.commit()
     flash('Appointment accepted.', 'success')
     return redirect(url_for('doctor_dashboard'))
@@ -356,10 +654,70 @@ def decline_appointment(appt_id):
         abort(403)
     appt.status = 'cancelled'
     appt.doctor_response = 'decline'
+    release_slot(appt)
+    record_change(appt, 'declined')
+    notify_appointment(appt, 'declined')
     db.session.commit()
     flash('Appointment declined.', 'success')
     return redirect(url_for('doctor_dashboard'))
 
+# --- Live appointment updates (Server-Sent Events) ---
+@app.route('/appointments/events')
+@login_required
+@use_primary
+def appointment_events():
+    """Stream the current user's appointment changes as they are committed.
+
+    Resumes after the Last-Event-ID header the browser sends on reconnect, or
+    after ?after= (the feed position the page was rendered at) on first connect.
+    Streams end after SSE_MAX_STREAM_SECONDS so they don't hold a server thread
+    for good; the browser reconnects on its own and loses nothing.
+    """
+    if current_user.is_admin:
+        abort(403)
+    doctor_id = current_user.doctor_profile.id if current_user.doctor_profile else None
+    after = request.headers.get('Last-Event-ID', type=int)
+    if after is None:
+        after = request.args.get('after', type=int)
+    try:
+        sub, head = changes.subscribe(doctor_id=doctor_id, patient_id=current_user.id)
+    except FeedFull:
+        return Response('Too many live connections.', 503, {'Retry-After': '30'})
+    try:
+        missed = [] if after is None or after >= head else changes.backlog(
+            after, head, doctor_id, current_user.id, limit=app.config['CHANGE_FEED_BACKLOG'])
+    except Exception:
+        changes.unsubscribe(sub)
+        raise
+    heartbeat = app.config['SSE_HEARTBEAT_SECONDS']
+    deadline = time.monotonic() + app.config['SSE_MAX_STREAM_SECONDS']
+
+    def stream():
+        try:
+            if missed is None:
+                # Too far behind to replay; the page reloads instead
+                yield f'id: {head}\nevent: resync\ndata: {{}}\n\n'
+            else:
+                for data in missed:
+                    yield format_sse(data)
+            yield f'retry: 3000\nid: {head}\n\n'
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                data = sub.get(min(heartbeat, remaining))
+                if data is not None:
+                    yield format_sse(data)
+                elif sub.closed:
+                    return
+                else:
+                    yield ': keepalive\n\n'
+        finally:
+            changes.unsubscribe(sub)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # --- Admin: view doctor's daily schedule ---
 @app.route('/admin/schedule/<int:doc_id>')
 @login_required
@@ -371,32 +729,145 @@ def admin_schedule(doc_id):
         try:
             date = datetime.strptime(date_str, '%Y-%m-%d').date()
         except ValueError:
-            date = datetime.utcnow().date()
+            date = availability.now().date()
     else:
-        date = datetime.utcnow().date()
-    appts = Appointment.query.filter_by(doctor_id=doc_id, date=date).order_by(Appointment.time).all()
+        date = availability.now().date()
+    appts = (Appointment.query.options(joinedload(Appointment.patient))
+             .filter_by(doctor_id=doc_id, date=date)
+             .order_by(Appointment.time).all())
+    appts += ArchivedAppointment.query.filter_by(doctor_id=doc_id, date=date).all()
+    appts.sort(key=lambda a: a.time)
     doc = Doctor.query.get_or_404(doc_id)
-    doctors = Doctor.query.order_by(Doctor.created_at.desc()).all()
-    users = User.query.order_by(User.id).all()
-    return render_template('admin_panel.html', doctors=doctors, users=users, schedule=appts, admin_email=app.config['ADMIN_EMAIL'], admin_contact=app.config['ADMIN_CONTACT'])
+    return render_admin_panel(schedule=appts)
+
+# --- Admin: streaming appointment export ---
+APPOINTMENT_STATUSES = ('pending', 'confirmed', 'cancelled')
+
+def export_filters(args):
+    """Filters for export_query() from ?doctor_id=&start=&end=&status=a,b; raises ValueError."""
+    status = [s for s in (args.get('status') or '').split(',') if s]
+    unknown = set(status) - set(APPOINTMENT_STATUSES)
+    if unknown:
+        raise ValueError(f'Unknown status: {", ".join(sorted(unknown))}')
+    doctor_id = args.get('doctor_id')
+    return {'doctor_id': int(doctor_id) if doctor_id else None,
+            'start': datetime.strptime(args['start'], '%Y-%m-%d').date() if args.get('start') else None,
+            'end': datetime.strptime(args['end'], '%Y-%m-%d').date() if args.get('end') else None,
+            'status': status}
+
+@app.route('/admin/appointments/export')
+@login_required
+@admin_required
+def export_appointments_view():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        abort(400, f'format must be one of: {", ".join(EXPORT_FORMATS)}')
+    try:
+        filters = export_filters(request.args)
+    except ValueError as e:
+        abort(400, str(e))
+    gzip = request.args.get('gzip') in ('1', 'true')
+    filename = f'appointments.{fmt}' + ('.gz' if gzip else '')
+    body = export_appointments(fmt, gzip=gzip, chunk_size=app.config['EXPORT_CHUNK_SIZE'], **filters)
+    return Response(stream_with_context(body), mimetype='application/gzip' if gzip else EXPORT_FORMATS[fmt],
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+# --- Admin: appointment analytics (reads appointment_rollups only) ---
+@app.route('/admin/analytics')
+@login_required
+@admin_required
+def admin_analytics():
+    today = availability.now().date()
+    try:
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else today
+        start = (datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start')
+                 else end - timedelta(days=app.config['ANALYTICS_DAYS'] - 1))
+    except ValueError:
+        abort(400, 'start and end must be YYYY-MM-DD')
+    if start > end:
+        abort(400, 'start must not be after end')
+    stats = rollup_summary(start, end, doctor_id=request.args.get('doctor_id', type=int),
+                            top=app.config['ANALYTICS_TOP_DOCTORS'])
+    if wants_json():
+        return jsonify(stats)
+    return render_template('admin_analytics.html', stats=stats)
 
 @app.route('/admin/delete_doctor/<int:doc_id>', methods=['POST'])
 @login_required
 @admin_required
 def delete_doctor(doc_id):
-    doc = Doctor.query.get_or_404(doc_id)
-    # Delete associated appointments first to avoid foreign key constraint
-    Appointment.query.filter_by(doctor_id=doc_id).delete()
-    db.session.delete(doc)
-    db.session.commit()
+    Doctor.query.get_or_404(doc_id)
+    # Appointments, slot reservations and feedback go with it via ON DELETE CASCADE
+    forget_identities(delete_doctors([Doctor.id == doc_id]).user_ids)
+    directory_changed(removed=doc_id)
     flash('Doctor deleted successfully', 'success')
     return redirect(url_for('admin_panel'))
 
+# --- Admin: bulk operations ---
+# Set-based UPDATE/DELETE statements over many rows, committed in chunks (see bulk.py)
+def bulk_response(message, count, endpoint):
+    if wants_json():
+        return jsonify({'message': message, 'count': count})
+    flash(message, 'success' if count else 'info')
+    return redirect(url_for(endpoint))
+
+def bulk_progress(action):
+    return lambda done: logger.info('Bulk %s: %d rows done', action, done)
+
+@app.route('/admin/doctors/bulk', methods=['POST'])
+@login_required
+@admin_required
+def bulk_doctors():
+    action = request.form.get('action')
+    criteria = doctor_selection(ids=request.form.getlist('doctor_id', type=int),
+                                unverified=request.form.get('unverified') == '1',
+                                older_than_days=request.form.get('older_than_days', type=int))
+    if action not in ('approve', 'delete') or not criteria:
+        abort(400, 'Choose approve or delete and select doctors or a filter.')
+    chunk_size = app.config['BULK_CHUNK_SIZE']
+    if action == 'approve':
+        result = approve_doctors(criteria, chunk_size=chunk_size, progress=bulk_progress('approve doctors'))
+        message = f'Approved {result.count} doctors.'
+    else:
+        result = delete_doctors(criteria, with_accounts=request.form.get('with_accounts') == '1',
+                                chunk_size=chunk_size, progress=bulk_progress('delete doctors'))
+        message = f'Deleted {result.count} doctors.'
+    forget_identities(result.user_ids)
+    directory_changed(reindex=True)
+    return bulk_response(message, result.count, 'admin_panel')
+
+@app.route('/admin/users/bulk', methods=['POST'])
+@login_required
+@admin_required
+def bulk_users():
+    role = request.form.get('role')
+    if request.form.get('action') != 'delete' or role not in (None, '', 'patient', 'doctor'):
+        abort(400, 'Only delete is supported, optionally limited to the patient or doctor role.')
+    ids = request.form.getlist('user_id', type=int)
+    if not ids and not role:
+        abort(400, 'Select users or a role.')
+    criteria = user_selection(ids=ids, role=UserRole(role) if role else None)
+    result = delete_users(criteria, chunk_size=app.config['BULK_CHUNK_SIZE'],
+                          progress=bulk_progress('delete users'))
+    forget_identities(result.user_ids)
+    directory_changed(reindex=bool(result.doctor_ids))
+    return bulk_response(f'Deleted {result.count} users.', result.count, 'admin_users')
+
+@app.route('/admin/cache')
+@login_required
+@admin_required
+def admin_cache_stats():
+    return jsonify({'directory': directory.stats(), 'identities': identities.stats(), 'fragments': fragments.stats(),
+                    'password_hasher': hasher.stats(), 'replicas': replicas.stats(),
+                    'change_feed': changes.stats(), 'outbox': outbox_counts()})
+
 @app.route('/admin_users')
 @login_required
 @admin_required
 def admin_users():
-    users = User.query.order_by(User.id).all()
+    users = paginate(User.query, [User.id])
+    if wants_json():
+        return jsonify(users.to_dict(User.to_dict))
     return render_template('admin_users.html', users=users)
 
 @app.route('/admin_edit_user/<int:user_id>', methods=['GET', 'POST'])
@@ -410,6 +881,7 @@ def admin_edit_user(user_id):
         user.city = form.city.data
         user.dob = form.dob.data
         db.session.commit()
+        identities.delete(user.id)
         flash('User updated.', 'success')
         return redirect(url_for('admin_users'))
     form.address.data = user.address
@@ -421,28 +893,426 @@ def admin_edit_user(user_id):
 @login_required
 @admin_required
 def admin_delete_user(user_id):
-    user = User.query.get_or_404(user_id)
-    # Delete associated doctor profile if exists
-    if hasattr(user, 'doctor_profile') and user.doctor_profile:
-        Appointment.query.filter_by(doctor_id=user.doctor_profile.id).delete()
-        db.session.delete(user.doctor_profile)
-    # Delete associated appointments as patient
-    Appointment.query.filter_by(patient_id=user_id).delete()
-    db.session.delete(user)
-    db.session.commit()
+    User.query.get_or_404(user_id)
+    # The database cascades to the doctor profile, appointments and feedback;
+    # doctors the user rated get their aggregates rebuilt
+    result = delete_users([User.id == user_id])
+    identities.delete(user_id)
+    directory_changed(removed=result.doctor_ids[0] if result.doctor_ids else None)
     flash('User deleted successfully', 'success')
     return redirect(url_for('admin_users'))
 
 
+# --- JSON API (/api/v1) ---
+# Same session-cookie auth as the site. Every write must carry a JSON body
+# (send {} when there is nothing to say), which a cross-site HTML form cannot
+# do, so the API needs no CSRF tokens. Responses are built from row tuples
+# and the in-process caches rather than hydrated ORM graphs.
+API_PREFIX = '/api/v1'
+
+def is_api_request():
+    return request.path.startswith(API_PREFIX + '/')
+
+def api_error(message, status, **extra):
+    return jsonify(dict(extra, error=message)), status
+
+@app.before_request
+def require_json_writes():
+    if is_api_request() and request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and not request.is_json:
+        abort(415, 'Send a JSON body with Content-Type: application/json.')
+
+def api_login_required(func):
+    @wraps(func)
+    def decorated(*args, **kwargs):
+        if not current_user.is_authenticated:
+            return api_error('Authentication required.', 401)
+        return func(*args, **kwargs)
+    return decorated
+
+def api_form(form_cls):
+    """Bind the JSON body to a form class so the API shares the site's validation."""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        abort(400, 'The JSON body must be an object.')
+    formdata = MultiDict({key: str(value) for key, value in payload.items() if value is not None})
+    return form_cls(formdata=formdata, meta={'csrf': False})
+
+@app.route(API_PREFIX + '/login', methods=['POST'])
+def api_login():
+    form = api_form(LoginForm)
+    if not form.validate():
+        return api_error('Invalid request.', 400, errors=form.errors)
+    user = User.query.filter_by(username=form.username.data).first()
+    if not user or not hasher.check(user.password_hash, form.password.data):
+        return api_error('Invalid credentials.', 401)
+    login_user(user)
+    return jsonify(user.to_dict())
+
+@app.route(API_PREFIX + '/logout', methods=['POST'])
+@api_login_required
+def api_logout():
+    logout_user()
+    return '', 204
+
+@app.route(API_PREFIX + '/doctors')
+def api_doctors():
+    return jsonify(directory_page())
+
+@app.route(API_PREFIX + '/doctors/<int:doc_id>')
+def api_doctor(doc_id):
+    doc = directory.get_or_load(('doctor', doc_id), lambda: load_doctor(doc_id))
+    if doc is None:
+        abort(404)
+    return jsonify(doc)
+
+@app.route(API_PREFIX + '/search')
+def api_search():
+    form = SearchForm(request.args, meta={'csrf': False})
+    if form.validate():
+        try:
+            doctors, total = search_doctors(form)
+        except ValueError as e:
+            form.date.errors.append(str(e))
+        else:
+            return jsonify(dict(doctors.to_dict(dict), total=total))
+    return api_error('Invalid search.', 400, errors=form.errors)
+
+def appointment_rows(model=Appointment):
+    return (db.session.query(model.id, model.doctor_id, Doctor.name.label('doctor_name'),
+                             model.patient_id, User.username.label('patient_name'),
+                             model.date, model.time, model.visit_type,
+                             model.status, model.notes, model.reschedule_count,
+                             model.doctor_response)
+            .join(Doctor, Doctor.id == model.doctor_id)
+            .join(User, User.id == model.patient_id))
+
+def appointment_dto(row):
+    data = row._asdict()
+    data['date'] = row.date.isoformat()
+    data['time'] = row.time.strftime('%H:%M')
+    return data
+
+def own_appointments(model=Appointment):
+    # Patients see their bookings and doctors also see their patients'; admins use the panel
+    if current_user.is_admin:
+        abort(403)
+    mine = model.patient_id == current_user.id
+    if current_user.doctor_profile:
+        mine = or_(mine, model.doctor_id == current_user.doctor_profile.id)
+    return appointment_rows(model).filter(mine)
+
+def api_appointment_response(appt_id, status=200):
+    # Appointments just written are hot; only fall back to the archive for old ones
+    row = (own_appointments(Appointment).filter(Appointment.id == appt_id).first()
+           or own_appointments(ArchivedAppointment).filter(ArchivedAppointment.id == appt_id).first())
+    if row is None:
+        abort(404)
+    return jsonify(appointment_dto(row)), status
+
+@app.route(API_PREFIX + '/appointments')
+@api_login_required
+def api_appointments():
+    status = request.args.get('status')
+
+    def tier(model):
+        query = own_appointments(model)
+        if status:
+            query = query.filter(model.status == status)
+        return query.statement
+
+    rows = history(tier)
+    page = paginate(db.session.query(rows), [rows.c.date, rows.c.time, rows.c.id])
+    return jsonify(page.to_dict(appointment_dto))
+
+@app.route(API_PREFIX + '/appointments/<int:appt_id>')
+@api_login_required
+def api_appointment(appt_id):
+    return api_appointment_response(appt_id)
+
+@app.route(API_PREFIX + '/appointments', methods=['POST'])
+@api_login_required
+def api_book():
+    if current_user.is_admin:
+        abort(403)
+    form = api_form(AppointmentForm)
+    doc_id = request.get_json().get('doctor_id')
+    doc = Doctor.query.get(doc_id) if isinstance(doc_id, int) else None
+    if doc is None or not doc.verified:
+        return api_error('Unknown or unverified doctor.', 404)
+    if not form.validate():
+        return api_error('Invalid appointment.', 400, errors=form.errors)
+    if not availability.is_open(doc, form.date.data, form.time.data):
+        return api_error('The doctor is not available at that time.', 409)
+    appt = Appointment(doctor_id=doc.id, patient_id=current_user.id, date=form.date.data,
+                       time=form.time.data, visit_type=form.visit_type.data,
+                       notes=form.notes.data, status='pending')
+    try:
+        reserve_slot(appt)
+        record_change(appt, 'booked')
+        notify_appointment(appt, 'booked')
+        db.session.commit()
+    except SlotTaken:
+        db.session.rollback()
+        return api_error('This slot is already taken.', 409)
+    return api_appointment_response(appt.id, 201)
+
+@app.route(API_PREFIX + '/appointments/<int:appt_id>/cancel', methods=['POST'])
+@api_login_required
+def api_cancel(appt_id):
+    appt = Appointment.query.get_or_404(appt_id)
+    if appt.patient_id != current_user.id:
+        abort(403)
+    appt.status = 'cancelled'
+    release_slot(appt)
+    record_change(appt, 'cancelled')
+    db.session.commit()
+    return api_appointment_response(appt_id)
+
+@app.route(API_PREFIX + '/appointments/<int:appt_id>/reschedule', methods=['POST'])
+@api_login_required
+def api_reschedule(appt_id):
+    appt = Appointment.query.get_or_404(appt_id)
+    if appt.patient_id != current_user.id:
+        abort(403)
+    if appt.status not in ['pending', 'confirmed']:
+        return api_error('Cannot reschedule this appointment.', 409)
+    form = api_form(RescheduleForm)
+    if not form.validate():
+        return api_error('Invalid reschedule.', 400, errors=form.errors)
+    if not availability.is_open(appt.doctor, form.date.data, form.time.data):
+        return api_error('The doctor is not available at that time.', 409)
+    try:
+        move_slot(appt, form.date.data, form.time.data)
+    except SlotTaken:
+        db.session.rollback()
+        return api_error('This slot is already taken.', 409)
+    appt.notes = form.notes.data
+    appt.reschedule_count = (appt.reschedule_count or 0) + 1
+    appt.status = 'pending'
+    appt.doctor_response = None
+    record_change(appt, 'rescheduled')
+    notify_appointment(appt, 'rescheduled')
+    db.session.commit()
+    return api_appointment_response(appt_id)
+
+def doctor_appointment_or_403(appt_id):
+    if current_user.role != UserRole.DOCTOR or not current_user.doctor_profile:
+        abort(403)
+    appt = Appointment.query.get_or_404(appt_id)
+    if appt.doctor_id != current_user.doctor_profile.id:
+        abort(403)
+    return appt
+
+@app.route(API_PREFIX + '/appointments/<int:appt_id>/accept', methods=['POST'])
+@api_login_required
+def api_accept(appt_id):
+    appt = doctor_appointment_or_403(appt_id)
+    try:
+        if appt.reservation is None:
+            move_slot(appt, appt.date, appt.time)
+    except SlotTaken:
+        db.session.rollback()
+        return api_error('This slot has been booked by another patient.', 409)
+    appt.status = 'confirmed'
+    appt.doctor_response = 'accept'
+    record_change(appt, 'accepted')
+    notify_appointment(appt, 'accepted')
+    db.session.commit()
+    return api_appointment_response(appt_id)
+
+@app.route(API_PREFIX + '/appointments/<int:appt_id>/decline', methods=['POST'])
+@api_login_required
+def api_decline(appt_id):
+    appt = doctor_appointment_or_403(appt_id)
+    appt.status = 'cancelled'
+    appt.doctor_response = 'decline'
+    release_slot(appt)
+    record_change(appt, 'declined')
+    notify_appointment(appt, 'declined')
+    db.session.commit()
+    return api_appointment_response(appt_id)
+
+PROFILE_FIELDS = ('address', 'city', 'dob')
+
+@app.route(API_PREFIX + '/profile')
+@api_login_required
+def api_profile():
+    row = (db.session.query(User.id, User.username, User.email, User.contact, User.role,
+                            User.address, User.city, User.dob)
+           .filter(User.id == current_user.id).first())
+    data = row._asdict()
+    data['role'] = row.role.value
+    data['dob'] = row.dob.isoformat() if row.dob else None
+    return jsonify(data)
+
+@app.route(API_PREFIX + '/profile', methods=['PATCH'])
+@api_login_required
+def api_update_profile():
+    form = api_form(ProfileForm)
+    if not form.validate():
+        return api_error('Invalid profile.', 400, errors=form.errors)
+    user = User.query.get_or_404(current_user.id)
+    # Only the fields present in the body change
+    for field in PROFILE_FIELDS:
+        if field in request.get_json():
+            setattr(user, field, form[field].data)
+    db.session.commit()
+    identities.delete(user.id)
+    return api_profile()
+
+# --- CLI commands ---
+@app.cli.command('recompute-ratings')
+@click.option('--chunk-size', default=1000, show_default=True, help='Doctors updated per transaction.')
+def recompute_ratings_command(chunk_size):
+    """Rebuild every doctor's rating aggregate from the feedbacks table."""
+    count = recompute_ratings(chunk_size=chunk_size)
+    directory_changed()
+    click.echo(f'Recomputed ratings for {count} doctors.')
+
+@app.cli.command('rebuild-rollups')
+@click.option('--chunk-size', default=500, show_default=True, help='Doctors rebuilt per transaction.')
+def rebuild_rollups_command(chunk_size):
+    """Recompute appointment_rollups from both appointment tiers."""
+    count = rebuild_rollups(chunk_size=chunk_size)
+    click.echo(f'Rebuilt appointment rollups for {count} doctors.')
+
+@app.cli.command('import-doctors')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), help='Defaults to the file extension.')
+@click.option('--batch-size', default=1000, show_default=True, help='Rows inserted per transaction.')
+@click.option('--errors', 'errors_path', type=click.Path(dir_okay=False),
+              help='Write rejected rows here as NDJSON (default: PATH.errors.ndjson).')
+@click.option('--pending', is_flag=True, help='Import doctors unverified instead of verified.')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint of an interrupted run.')
+def import_doctors_command(path, fmt, batch_size, errors_path, pending, restart):
+    """Stream doctors (and optional doctor logins) from a CSV or NDJSON file."""
+    errors_path = errors_path or path + '.errors.ndjson'
+    with open(errors_path, 'w' if restart else 'a', encoding='utf-8') as errors:
+        importer = DoctorImporter(batch_size=batch_size, verified=not pending, errors=errors, echo=click.echo)
+        stats = importer.run(path, fmt, resume=not restart)
+    directory_changed()
+    click.echo(f'Imported {stats["imported"]} doctors; {stats["failed"]} rows rejected'
+               f'{f" (see {errors_path})" if stats["failed"] else ""}; {stats["skipped"]} already done.')
+
+@app.cli.command('bulk-doctors')
+@click.argument('action', type=click.Choice(['approve', 'delete']))
+@click.option('--id', 'ids', type=int, multiple=True, help='Doctor id; repeat for several.')
+@click.option('--unverified', is_flag=True, help='Only doctors not yet verified.')
+@click.option('--older-than', type=int, metavar='DAYS', help='Only doctors created more than DAYS ago.')
+@click.option('--with-accounts', is_flag=True, help='When deleting, delete the doctors\' logins too.')
+@click.option('--chunk-size', type=int, help='Rows per transaction (default: BULK_CHUNK_SIZE).')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def bulk_doctors_command(action, ids, unverified, older_than, with_accounts, chunk_size, yes):
+    """Approve or delete every doctor matching the given ids/filters."""
+    criteria = doctor_selection(ids=ids, unverified=unverified, older_than_days=older_than)
+    if not criteria:
+        raise click.UsageError('Pass --id, --unverified or --older-than.')
+    matching = count_matching(Doctor, criteria + (doctor_selection(unverified=True) if action == 'approve' else []))
+    if not yes:
+        click.confirm(f'{action.capitalize()} {matching} doctors?', abort=True)
+    progress = lambda done: click.echo(f'{done}/{matching}')
+    chunk_size = chunk_size or app.config['BULK_CHUNK_SIZE']
+    if action == 'approve':
+        result = approve_doctors(criteria, chunk_size=chunk_size, progress=progress)
+    else:
+        result = delete_doctors(criteria, with_accounts=with_accounts, chunk_size=chunk_size, progress=progress)
+    directory_changed(reindex=True)
+    click.echo(f'{action.capitalize()}d {result.count} doctors.')
+
+@app.cli.command('bulk-delete-users')
+@click.option('--id', 'ids', type=int, multiple=True, help='User id; repeat for several.')
+@click.option('--role', type=click.Choice(['patient', 'doctor']))
+@click.option('--chunk-size', type=int, help='Rows per transaction (default: BULK_CHUNK_SIZE).')
+@click.option('--yes', is_flag=True, help='Do not ask for confirmation.')
+def bulk_delete_users_command(ids, role, chunk_size, yes):
+    """Delete users (never admins) with their profiles, appointments and feedback."""
+    if not ids and not role:
+        raise click.UsageError('Pass --id or --role.')
+    criteria = user_selection(ids=ids, role=UserRole(role) if role else None)
+    matching = count_matching(User, criteria)
+    if not yes:
+        click.confirm(f'Delete {matching} users?', abort=True)
+    result = delete_users(criteria, chunk_size=chunk_size or app.config['BULK_CHUNK_SIZE'],
+                          progress=lambda done: click.echo(f'{done}/{matching}'))
+    directory_changed(reindex=True)
+    click.echo(f'Deleted {result.count} users.')
+
+@app.cli.command('archive-appointments')
+@click.option('--older-than', 'days', type=int, help='Archive appointments this many days old (default ARCHIVE_AFTER_DAYS).')
+@click.option('--chunk-size', type=int, help='Appointments moved per transaction (default ARCHIVE_CHUNK_SIZE).')
+def archive_appointments_command(days, chunk_size):
+    """Move past and cancelled appointments to the archive tier; run it from cron."""
+    moved = archive_appointments(app.config['ARCHIVE_AFTER_DAYS'] if days is None else days,
+                                 chunk_size=chunk_size or app.config['ARCHIVE_CHUNK_SIZE'],
+                                 progress=lambda n: click.echo(f'Archived {n} appointments...'))
+    click.echo(f'Archived {moved} appointments.')
+
+@app.cli.command('send-mail')
+@click.option('--once', is_flag=True, help='Send what is due and exit instead of polling.')
+@click.option('--interval', default=5.0, show_default=True, help='Seconds between outbox polls.')
+@click.option('--batch-size', type=int, help='Messages claimed per batch (default MAIL_BATCH_SIZE).')
+@click.option('--connections', type=int, help='SMTP connections kept open (default MAIL_CONNECTIONS).')
+def send_mail_command(once, interval, batch_size, connections):
+    """Deliver queued emails from the outbox, retrying failures with backoff."""
+    # Flask-Mail opens SMTP connections without a timeout; this process only talks SMTP and SQL
+    socket.setdefaulttimeout(app.config['MAIL_TIMEOUT'])
+    worker = MailWorker(app, mail, batch_size=batch_size or app.config['MAIL_BATCH_SIZE'],
+                        connections=connections or app.config['MAIL_CONNECTIONS'],
+                        max_attempts=app.config['MAIL_MAX_ATTEMPTS'],
+                        retry_seconds=app.config['MAIL_RETRY_SECONDS'],
+                        retry_max_seconds=app.config['MAIL_RETRY_MAX_SECONDS'])
+    worker.run(interval=interval, once=once, echo=click.echo)
+
+@app.cli.command('prune-appointment-events')
+@click.option('--days', default=7, show_default=True, help='Keep events newer than this.')
+def prune_appointment_events_command(days):
+    """Delete old change-feed events; clients further behind than that just reload."""
+    count = prune_changes(datetime.utcnow() - timedelta(days=days))
+    click.echo(f'Deleted {count} appointment events.')
+
+@app.cli.command('export-appointments')
+@click.option('--output', '-o', type=click.File('wb'), default='-', help='Defaults to stdout.')
+@click.option('--format', 'fmt', type=click.Choice(list(EXPORT_FORMATS)), default='csv', show_default=True)
+@click.option('--gzip', is_flag=True, help='Compress the output with gzip.')
+@click.option('--doctor-id', type=int)
+@click.option('--start', type=click.DateTime(['%Y-%m-%d']), help='First appointment date included.')
+@click.option('--end', type=click.DateTime(['%Y-%m-%d']), help='Last appointment date included.')
+@click.option('--status', type=click.Choice(APPOINTMENT_STATUSES), multiple=True)
+@click.option('--chunk-size', type=int, help='Rows fetched per round trip (default: EXPORT_CHUNK_SIZE).')
+def export_appointments_command(output, fmt, gzip, doctor_id, start, end, status, chunk_size):
+    """Stream appointments with doctor and patient names as CSV or NDJSON."""
+    chunk_size = chunk_size or app.config['EXPORT_CHUNK_SIZE']
+    for chunk in export_appointments(fmt, gzip=gzip, chunk_size=chunk_size, doctor_id=doctor_id,
+                                     start=start.date() if start else None,
+                                     end=end.date() if end else None, status=list(status)):
+        output.write(chunk)
 
 # --- Error handlers ---
+@app.errorhandler(HTTPException)
+def http_error(e):
+    if is_api_request():
+        return api_error(e.description, e.code)
+    return e
+
 @app.errorhandler(403)
 def forbidden(e):
+    if is_api_request():
+        return api_error(e.description, 403)
     return render_template('404.html', message='Forbidden (403)'), 403
 
 @app.errorhandler(404)
 def not_found(e):
+    if is_api_request():
+        return api_error(e.description, 404)
     return render_template('404.html', message='Not found (404)'), 404
 
+@app.errorhandler(HasherBusy)
+def hasher_busy(e):
+    logger.warning('Password hashing saturated, rejecting %s %s', request.method, request.path)
+    if is_api_request():
+        return api_error('Too many sign-in requests, retry shortly.', 503) + ({'Retry-After': str(e.retry_after)},)
+    return (render_template('404.html', message='Too many sign-in requests right now, please retry in a few seconds (503)'),
+            503, {'Retry-After': str(e.retry_after)})
+
 if __name__ == '__main__':
     app.run(debug=True)
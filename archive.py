@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+from sqlalchemy import and_, delete, exists, insert, literal, or_, select, union_all
+from models import db, Appointment, ArchivedAppointment
+
+# Columns copied from the hot table; the archive adds archived_at
+COLUMNS = ('id', 'doctor_id', 'patient_id', 'date', 'time', 'visit_type', 'notes', 'status',
+           'reschedule_count', 'doctor_response', 'created_at')
+TIERS = (Appointment, ArchivedAppointment)
+
+
+def archivable(days):
+    """WHERE criteria for hot appointments that can move to the archive.
+
+    That is anything dated more than ``days`` ago, and cancelled appointments
+    booked (``created_at``) that long ago even if their date is still ahead.
+    """
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    return or_(Appointment.date < cutoff.date(),
+               and_(Appointment.status == 'cancelled', Appointment.created_at < cutoff))
+
+
+def archive_appointments(days, chunk_size=1000, progress=None):
+    """Move archivable appointments to appointments_archive, one transaction per chunk.
+
+    Each chunk is locked, copied with INSERT ... SELECT and deleted from the
+    hot table in the same transaction; their slot reservations and change-feed
+    events go with them through ON DELETE CASCADE.
+    """
+    criteria = archivable(days)
+    moved, last = 0, 0
+    while True:
+        ids = db.session.scalars(select(Appointment.id).where(Appointment.id > last, criteria)
+                                 .order_by(Appointment.id).limit(chunk_size).with_for_update()).all()
+        if not ids:
+            return moved
+        now = datetime.utcnow()
+        db.session.execute(insert(ArchivedAppointment).from_select(
+            COLUMNS + ('archived_at',),
+            select(*[getattr(Appointment, column) for column in COLUMNS], literal(now))
+            .where(Appointment.id.in_(ids))))
+        db.session.execute(delete(Appointment).where(Appointment.id.in_(ids))
+                           .execution_options(synchronize_session=False))
+        db.session.commit()
+        moved += len(ids)
+        last = ids[-1]
+        if progress:
+            progress(moved)
+
+
+def history(build):
+    """UNION ALL of ``build(model)`` over both tiers, as a subquery named ``history``.
+
+    ``build`` should apply its filters per tier so each side uses its own indexes.
+    """
+    return union_all(*[build(model) for model in TIERS]).subquery('history')
+
+
+def has_visited(patient_id, doctor_id):
+    """Whether the patient has an appointment with the doctor that was not cancelled, in either tier."""
+    return any(db.session.scalar(select(exists().where(model.patient_id == patient_id,
+                                                       model.doctor_id == doctor_id,
+                                                       model.status != 'cancelled')))
+               for model in TIERS)
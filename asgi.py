@@ -0,0 +1,11 @@
+"""Optional ASGI entry point: ``uvicorn asgi:application --workers 4``.
+
+Needs ``pip install uvicorn``; a2wsgi comes with requirement.txt. The event
+loop does the socket I/O, so slow clients upload and download without
+holding a request thread. Each request runs the (sync) Flask app on a pool
+of ASGI_THREADS threads per process, so that many run at once.
+"""
+from a2wsgi import WSGIMiddleware
+from app import app
+
+application = WSGIMiddleware(app, workers=app.config['ASGI_THREADS'])
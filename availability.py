@@ -0,0 +1,129 @@
+import json
+from datetime import datetime, time as time_cls, timedelta
+from zoneinfo import ZoneInfo
+from models import db, SlotReservation
+
+WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+
+def parse_hhmm(text):
+    hours, minutes = text.strip().split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def compile_schedule(spec, slot_minutes):
+    """Compile {"mon": ["09:00-13:00", ...], ...} into one slot bitmap per weekday.
+
+    Bit i of a day's bitmap is set when the slot starting at
+    ``i * slot_minutes`` minutes past midnight lies inside a working window.
+    """
+    if isinstance(spec, str):
+        spec = json.loads(spec)
+    bitmaps = [0] * 7
+    for day, windows in spec.items():
+        weekday = WEEKDAYS.index(day.lower()[:3])
+        for window in windows:
+            start, end = (parse_hhmm(part) for part in window.split('-'))
+            first = -(-start // slot_minutes)
+            last = end // slot_minutes
+            if last > first:
+                bitmaps[weekday] |= ((1 << (last - first)) - 1) << first
+    return tuple(bitmaps)
+
+
+def slot_index(t, slot_minutes):
+    minutes = t.hour * 60 + t.minute
+    return minutes // slot_minutes if minutes % slot_minutes == 0 and not t.second else None
+
+
+def iter_slots(bits, slot_minutes):
+    while bits:
+        low = bits & -bits
+        minutes = (low.bit_length() - 1) * slot_minutes
+        yield time_cls(minutes // 60, minutes % 60)
+        bits ^= low
+
+
+class AvailabilityEngine:
+    """Free-slot queries over Doctor.availability minus reserved slots.
+
+    Weekly schedules are compiled once per doctor into per-weekday bitmaps and
+    recompiled only when the availability text changes. Booked slots come from
+    the slot_reservations unique index, so a query never scans appointments.
+    Doctors without a (valid) schedule fall back to ``default_spec``.
+    Appointment dates and times are the clinic's wall clock in ``timezone``
+    (server local time if unset); see ``now()``.
+    """
+
+    def __init__(self, slot_minutes=30, default_spec=None, horizon_days=60, timezone=None):
+        self.slot_minutes = slot_minutes
+        self.horizon_days = horizon_days
+        self.timezone = ZoneInfo(timezone) if timezone else None
+        self.default = compile_schedule(default_spec or {}, slot_minutes)
+        self._compiled = {}
+
+    def now(self):
+        """Current clinic time, naive like Appointment.date/time."""
+        return datetime.now(self.timezone).replace(tzinfo=None)
+
+    def schedule(self, doctor):
+        cached = self._compiled.get(doctor.id)
+        if cached is not None and cached[0] == doctor.availability:
+            return cached[1]
+        try:
+            bitmaps = compile_schedule(doctor.availability, self.slot_minutes) if doctor.availability else self.default
+        except (ValueError, AttributeError, TypeError):
+            bitmaps = self.default
+        self._compiled[doctor.id] = (doctor.availability, bitmaps)
+        return bitmaps
+
+    def busy(self, doctor_id, start, end):
+        """Reserved-slot bitmaps keyed by date for start <= date <= end."""
+        rows = (db.session.query(SlotReservation.date, SlotReservation.time)
+                .filter(SlotReservation.doctor_id == doctor_id,
+                        SlotReservation.date >= start, SlotReservation.date <= end))
+        busy = {}
+        for day, t in rows:
+            index = slot_index(t, self.slot_minutes)
+            if index is not None:
+                busy[day] = busy.get(day, 0) | (1 << index)
+        return busy
+
+    def _free_bits(self, schedule, busy, day, now):
+        bits = schedule[day.weekday()] & ~busy.get(day, 0)
+        if day == now.date():
+            # Drop slots that have already started
+            elapsed = now.hour * 60 + now.minute
+            bits &= ~((1 << (elapsed // self.slot_minutes + 1)) - 1)
+        elif day < now.date():
+            bits = 0
+        return bits
+
+    def free_slots(self, doctor, day, now=None):
+        now = now or self.now()
+        bits = self._free_bits(self.schedule(doctor), self.busy(doctor.id, day, day), day, now)
+        return list(iter_slots(bits, self.slot_minutes))
+
+    def next_free_slots(self, doctor, count, now=None):
+        now = now or self.now()
+        start = now.date()
+        end = start + timedelta(days=self.horizon_days)
+        schedule = self.schedule(doctor)
+        busy = self.busy(doctor.id, start, end)
+        found = []
+        day = start
+        while day <= end and len(found) < count:
+            for t in iter_slots(self._free_bits(schedule, busy, day, now), self.slot_minutes):
+                found.append(datetime.combine(day, t))
+                if len(found) == count:
+                    break
+            day += timedelta(days=1)
+        return found
+
+    def is_open(self, doctor, day, t, now=None):
+        """True if day/t is a future, slot-aligned time inside the doctor's schedule."""
+        now = now or self.now()
+        index = slot_index(t, self.slot_minutes)
+        if index is None or datetime.combine(day, t) <= now:
+            return False
+        return bool(self.schedule(doctor)[day.weekday()] >> index & 1)
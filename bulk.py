@@ -0,0 +1,132 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, or_, select, update
+from models import db, User, Doctor, Feedback, UserRole
+from outbox import notify_doctors_approved
+from ratings import recompute_ratings
+from rollups import rebuild_rollups
+from archive import TIERS
+
+# Ids touched by a bulk operation, for cache invalidation
+BulkResult = namedtuple('BulkResult', 'count doctor_ids user_ids')
+
+
+def doctor_selection(ids=None, unverified=False, older_than_days=None):
+    """WHERE criteria for doctors picked by id and/or by filter."""
+    criteria = []
+    if ids:
+        criteria.append(Doctor.id.in_(ids))
+    if unverified:
+        criteria.append(or_(Doctor.verified.is_(False), Doctor.verified.is_(None)))
+    if older_than_days is not None:
+        criteria.append(Doctor.created_at < datetime.utcnow() - timedelta(days=older_than_days))
+    return criteria
+
+
+def user_selection(ids=None, role=None):
+    """WHERE criteria for users picked by id and/or role; admins are never selected."""
+    criteria = [or_(User.role.is_(None), User.role != UserRole.ADMIN)]
+    if ids:
+        criteria.append(User.id.in_(ids))
+    if role is not None:
+        criteria.append(User.role == role)
+    return criteria
+
+
+def count_matching(model, criteria):
+    return db.session.scalar(select(func.count(model.id)).where(*criteria))
+
+
+def _chunks(columns, criteria, chunk_size):
+    """Yield matching rows in id order, chunk_size at a time, resuming after the last id seen."""
+    key = columns[0]
+    last = 0
+    while True:
+        rows = db.session.execute(select(*columns).where(key > last, *criteria)
+                                  .order_by(key).limit(chunk_size)).all()
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def _run(model, statement, ids):
+    db.session.execute(statement.where(model.id.in_(ids)).execution_options(synchronize_session=False))
+
+
+def approve_doctors(criteria, chunk_size=500, progress=None):
+    """Mark matching unverified doctors verified and queue their emails, one commit per chunk."""
+    criteria = criteria + doctor_selection(unverified=True)
+    doctor_ids, user_ids = [], []
+    for rows in _chunks((Doctor.id, Doctor.user_id), criteria, chunk_size):
+        ids = [row.id for row in rows]
+        _run(Doctor, update(Doctor).values(verified=True), ids)
+        notify_doctors_approved(ids)
+        db.session.commit()
+        doctor_ids += ids
+        user_ids += [row.user_id for row in rows if row.user_id]
+        if progress:
+            progress(len(doctor_ids))
+    return BulkResult(len(doctor_ids), doctor_ids, user_ids)
+
+
+def delete_doctors(criteria, with_accounts=False, chunk_size=500, progress=None):
+    """Delete matching doctors; the database cascades to appointments, slots and feedback.
+
+    With ``with_accounts`` the doctors' logins are deleted as well (which
+    cascades to the profiles), as when cleaning out spam registrations.
+    """
+    doctor_ids, user_ids, rated, visited = [], [], set(), set()
+    for rows in _chunks((Doctor.id, Doctor.user_id), criteria, chunk_size):
+        ids = [row.id for row in rows]
+        logins = [row.user_id for row in rows if row.user_id]
+        if with_accounts and logins:
+            their_rated, their_visited = _delete_users(logins)
+            rated.update(their_rated)
+            visited.update(their_visited)
+        _run(Doctor, delete(Doctor), ids)
+        db.session.commit()
+        doctor_ids += ids
+        # Kept logins are listed too: their cached identity still carries the profile
+        user_ids += logins
+        if progress:
+            progress(len(doctor_ids))
+    if rated:
+        recompute_ratings(sorted(rated - set(doctor_ids)))
+    if visited - set(doctor_ids):
+        rebuild_rollups(sorted(visited - set(doctor_ids)))
+    return BulkResult(len(doctor_ids), doctor_ids, user_ids)
+
+
+def delete_users(criteria, chunk_size=500, progress=None):
+    """Delete matching users; the database cascades to their doctor profile, appointments and feedback.
+
+    Doctors they had rated or booked get their rating aggregates and
+    appointment rollups rebuilt afterwards.
+    """
+    doctor_ids, user_ids, rated, visited = [], [], set(), set()
+    for rows in _chunks((User.id,), criteria, chunk_size):
+        ids = [row.id for row in rows]
+        doctor_ids += db.session.scalars(select(Doctor.id).where(Doctor.user_id.in_(ids))).all()
+        their_rated, their_visited = _delete_users(ids)
+        rated.update(their_rated)
+        visited.update(their_visited)
+        db.session.commit()
+        user_ids += ids
+        if progress:
+            progress(len(user_ids))
+    if rated:
+        recompute_ratings(sorted(rated - set(doctor_ids)))
+    if visited - set(doctor_ids):
+        rebuild_rollups(sorted(visited - set(doctor_ids)))
+    return BulkResult(len(user_ids), doctor_ids, user_ids)
+
+
+def _delete_users(ids):
+    # Their feedback and appointments go with them, so the doctors they rated
+    # or booked need new aggregates; returns (rated, visited) doctor ids
+    rated = db.session.scalars(select(Feedback.doctor_id).where(Feedback.user_id.in_(ids)).distinct()).all()
+    visited = {doctor_id for model in TIERS for doctor_id in db.session.scalars(
+        select(model.doctor_id).where(model.patient_id.in_(ids)).distinct())}
+    _run(User, delete(User), ids)
+    return rated, visited
@@ -0,0 +1,88 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Bounded, thread-safe LRU cache with per-entry TTL and versioned invalidation.
+
+    The cache lives in a single worker process. Writes that happen in another
+    worker are only picked up once the entry's TTL runs out, so keep the TTL
+    short enough to bound staleness across processes.
+    """
+
+    def __init__(self, maxsize=256, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, version=None):
+        with self._lock:
+            # A load that raced with invalidate() must not repopulate stale data
+            if version is not None and version != self.version:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        version = self.version
+        value = loader()
+        self.set(key, value, version)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def invalidate(self):
+        """Drop every entry and bump the version so in-flight loads are discarded."""
+        with self._lock:
+            self.version += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries),
+                    'maxsize': self.maxsize, 'ttl': self.ttl, 'version': self.version}
+
+
+class FragmentCache(TTLCache):
+    """TTLCache for rendered HTML fragments, with a version stamp per object.
+
+    Callers put ``stamp(obj_id)`` in their keys; ``bump(obj_id)`` then makes
+    that object's fragments miss while every other entry stays warm. The
+    superseded entries are never read again and fall out through the LRU.
+    """
+
+    def __init__(self, maxsize=2048, ttl=60):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._stamps = {}
+
+    def stamp(self, obj_id):
+        return self._stamps.get(obj_id, 0)
+
+    def bump(self, obj_id):
+        with self._lock:
+            self._stamps[obj_id] = self._stamps.get(obj_id, 0) + 1
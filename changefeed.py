@@ -0,0 +1,220 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from sqlalchemy import delete, event, func, or_, select
+from sqlalchemy.orm import Session
+from models import db, AppointmentEvent
+
+EVENT_COLUMNS = ('id', 'kind', 'appointment_id', 'doctor_id', 'patient_id', 'status', 'date', 'time')
+
+
+class FeedFull(Exception):
+    """Raised when the process already serves its maximum number of live subscribers."""
+
+
+def record_change(appt, kind):
+    """Append an event for ``appt`` to the change feed inside the caller's transaction."""
+    if appt.id is None:
+        db.session.flush()
+    db.session.add(AppointmentEvent(appointment_id=appt.id, doctor_id=appt.doctor_id,
+                                    patient_id=appt.patient_id, kind=kind, status=appt.status,
+                                    date=appt.date, time=appt.time))
+    db.session.info['changefeed_written'] = True
+
+
+def event_dict(row):
+    data = {column: getattr(row, column) for column in EVENT_COLUMNS}
+    data['date'] = row.date.isoformat()
+    data['time'] = row.time.strftime('%H:%M')
+    return data
+
+
+def format_sse(data, name='appointment'):
+    return f'id: {data["id"]}\nevent: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+class Subscription:
+    """One connected client: a bounded buffer of events for one doctor and/or patient.
+
+    A client that falls ``maxlen`` events behind is closed instead of growing
+    the buffer; its browser reconnects and catches up from the table.
+    """
+
+    def __init__(self, doctor_id, patient_id, maxlen):
+        self.doctor_id = doctor_id
+        self.patient_id = patient_id
+        self.maxlen = maxlen
+        self.closed = False
+        self._events = deque()
+        self._ready = threading.Condition()
+
+    def matches(self, data):
+        return data['doctor_id'] == self.doctor_id or data['patient_id'] == self.patient_id
+
+    def push(self, data):
+        with self._ready:
+            if len(self._events) >= self.maxlen:
+                self.closed = True
+            else:
+                self._events.append(data)
+            self._ready.notify()
+
+    def close(self):
+        with self._ready:
+            self.closed = True
+            self._ready.notify()
+
+    def get(self, timeout):
+        """Next event, or None after ``timeout`` seconds or once closed and drained."""
+        with self._ready:
+            if not self._events and not self.closed:
+                self._ready.wait(timeout)
+            return self._events.popleft() if self._events else None
+
+
+class ChangeFeed:
+    """Fans new appointment_events rows out to this process's live subscribers.
+
+    One background thread polls the table (every ``poll_interval`` seconds, or
+    at once after a local commit wrote an event) and only while someone is
+    subscribed. Ids can commit out of order under concurrent writers, so a
+    gap in the sequence is waited on for ``gap_timeout`` seconds before it is
+    taken to be a rolled-back insert and skipped.
+    """
+
+    def __init__(self, app, poll_interval=1.0, max_subscribers=200, buffer_size=100, gap_timeout=5.0):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self.buffer_size = buffer_size
+        self.gap_timeout = gap_timeout
+        self.last_id = None
+        self.subscribers = set()
+        self.delivered = 0
+        self.dropped = 0
+        self._gap = None
+        self._pid = None
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+
+    # --- Subscribers ---
+    def subscribe(self, doctor_id=None, patient_id=None):
+        """Register a subscriber; returns it with the last event id already delivered."""
+        self._ensure_thread()
+        with self._lock:
+            if len(self.subscribers) >= self.max_subscribers:
+                raise FeedFull()
+            if self.last_id is None:
+                self.last_id = self.head()
+            sub = Subscription(doctor_id, patient_id, self.buffer_size)
+            self.subscribers.add(sub)
+            return sub, self.last_id
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self.subscribers.discard(sub)
+            if not self.subscribers:
+                # Nobody listens, so stop polling; the next subscriber re-reads the head
+                self.last_id = None
+
+    def backlog(self, after, upto, doctor_id=None, patient_id=None, limit=500):
+        """Events a reconnecting client missed, or None if there are more than ``limit``."""
+        rows = db.session.execute(
+            select(AppointmentEvent).where(AppointmentEvent.id > after, AppointmentEvent.id <= upto,
+                                           or_(AppointmentEvent.doctor_id == doctor_id,
+                                               AppointmentEvent.patient_id == patient_id))
+            .order_by(AppointmentEvent.id).limit(limit + 1)).scalars().all()
+        if len(rows) > limit:
+            return None
+        return [event_dict(row) for row in rows]
+
+    @staticmethod
+    def head():
+        return db.session.scalar(select(func.max(AppointmentEvent.id))) or 0
+
+    def stats(self):
+        with self._lock:
+            return {'subscribers': len(self.subscribers), 'last_id': self.last_id,
+                    'delivered': self.delivered, 'dropped': self.dropped}
+
+    # --- Polling ---
+    def watch(self):
+        """Poll right after any local commit that recorded a change."""
+
+        @event.listens_for(Session, 'after_commit')
+        def written(session):
+            if session.info.pop('changefeed_written', False):
+                self._wake.set()
+
+        @event.listens_for(Session, 'after_rollback')
+        def discarded(session):
+            session.info.pop('changefeed_written', None)
+
+    def _ensure_thread(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.subscribers = set()
+            self.last_id = None
+        threading.Thread(target=self._run, name='changefeed', daemon=True).start()
+
+    def _run(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                self.poll()
+            except Exception:
+                self.app.logger.exception('Change feed poll failed')
+
+    def poll(self):
+        with self._lock:
+            after = self.last_id
+        if after is None:
+            return
+        with self.app.app_context():
+            with db.engine.connect() as conn:
+                rows = conn.execute(select(AppointmentEvent.__table__).where(AppointmentEvent.id > after)
+                                    .order_by(AppointmentEvent.id).limit(1000)).all()
+        with self._lock:
+            if self.last_id != after:
+                return
+            for row in rows:
+                if row.id != self.last_id + 1 and not self._skip_gap(self.last_id + 1):
+                    break
+                data = event_dict(row)
+                for sub in list(self.subscribers):
+                    if sub.matches(data):
+                        sub.push(data)
+                        if sub.closed:
+                            self.subscribers.discard(sub)
+                            self.dropped += 1
+                        else:
+                            self.delivered += 1
+                self.last_id = row.id
+                self._gap = None
+
+    def _skip_gap(self, missing_id):
+        now = time.monotonic()
+        if self._gap is None or self._gap[0] != missing_id:
+            self._gap = (missing_id, now)
+        return now - self._gap[1] >= self.gap_timeout
+
+
+def prune(before, chunk_size=5000):
+    """Delete events created before ``before`` in chunks; returns how many went."""
+    deleted = 0
+    while True:
+        ids = db.session.scalars(select(AppointmentEvent.id).where(AppointmentEvent.created_at < before)
+                                 .order_by(AppointmentEvent.id).limit(chunk_size)).all()
+        if not ids:
+            return deleted
+        db.session.execute(delete(AppointmentEvent).where(AppointmentEvent.id.in_(ids))
+                           .execution_options(synchronize_session=False))
+        db.session.commit()
+        deleted += len(ids)
@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+import zlib
+from models import db, User, Doctor, Appointment, ArchivedAppointment
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+EXPORT_COLUMNS = ('id', 'doctor_id', 'doctor_name', 'patient_id', 'patient_name', 'patient_email', 'date', 'time',
+                  'visit_type', 'status', 'doctor_response', 'reschedule_count', 'notes', 'created_at')
+
+
+def export_query(doctor_id=None, start=None, end=None, status=None, model=Appointment):
+    """Appointments of one tier with doctor and patient names joined in, oldest id first."""
+    query = (db.select(model.id, model.doctor_id, Doctor.name.label('doctor_name'),
+                       model.patient_id, User.username.label('patient_name'),
+                       User.email.label('patient_email'), model.date, model.time,
+                       model.visit_type, model.status, model.doctor_response,
+                       model.reschedule_count, model.notes, model.created_at)
+             .join(Doctor, Doctor.id == model.doctor_id)
+             .join(User, User.id == model.patient_id)
+             .order_by(model.id))
+    if doctor_id is not None:
+        query = query.where(model.doctor_id == doctor_id)
+    if start is not None:
+        query = query.where(model.date >= start)
+    if end is not None:
+        query = query.where(model.date <= end)
+    if status:
+        query = query.where(model.status.in_(status))
+    return query
+
+
+def iter_chunks(query, chunk_size=1000):
+    """Yield lists of rows from a server-side cursor, chunk_size at a time."""
+    result = db.session.execute(query.execution_options(stream_results=True, yield_per=chunk_size))
+    try:
+        yield from result.partitions()
+    finally:
+        result.close()
+
+
+def _value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def encode(chunks, fmt):
+    """Turn row chunks into text chunks; the CSV header comes first."""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in chunks:
+            writer.writerows([_value(v) for v in row] for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for rows in chunks:
+            yield ''.join(json.dumps(dict(zip(EXPORT_COLUMNS, map(_value, row)))) + '\n' for row in rows)
+
+
+def gzipped(chunks, level=6):
+    """Compress text chunks into one gzip stream as they are produced."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_appointments(fmt='csv', gzip=False, chunk_size=1000, **filters):
+    """Bytes of the whole export, produced lazily; memory use does not grow with the table."""
+    # The archive holds the older appointments, so it goes first; each tier streams from its own cursor
+    rows = (rows for model in (ArchivedAppointment, Appointment)
+            for rows in iter_chunks(export_query(model=model, **filters), chunk_size))
+    chunks = encode(rows, fmt)
+    if gzip:
+        return gzipped(chunks)
+    return (chunk.encode('utf-8') for chunk in chunks)
@@ -55,10 +55,15 @@ class DoctorForm(FlaskForm):
 
 # --- Search Form ---
 class SearchForm(FlaskForm):
+    q = StringField('Keywords', validators=[Optional()])
     specialization = StringField('Specialization', validators=[Optional()])
     city = StringField('City', validators=[Optional()])
     min_fees = FloatField('Max Fees', validators=[Optional(), NumberRange(min=0)])
     min_rating = FloatField('Min Rating', validators=[Optional(), NumberRange(min=0, max=5)])
+    date = DateField('Free On', validators=[Optional()])
+    time = TimeField('Free At', validators=[Optional()])
+    visit_mode = SelectField('Consultation', choices=[('', 'Any'), ('clinic', 'Clinic Visit'), ('online', 'Online')],
+                             default='', validators=[Optional()])
     submit = SubmitField('Search')
 
 # --- Appointment Form (for users) ---
@@ -76,6 +81,12 @@ class RescheduleForm(FlaskForm):
     notes = TextAreaField('Reason for Reschedule', validators=[Optional(), Length(max=200)])
     submit = SubmitField('Reschedule')
 
+# --- Feedback Form ---
+class FeedbackForm(FlaskForm):
+    rating = SelectField('Rating', choices=[(i, str(i)) for i in range(5, 0, -1)], coerce=int)
+    comment = TextAreaField('Comment', validators=[Optional(), Length(max=500)])
+    submit = SubmitField('Submit Feedback')
+
 # --- Inquiry Form ---
 class InquiryForm(FlaskForm):
     message = TextAreaField('Message', validators=[DataRequired(), Length(max=500)])
@@ -0,0 +1,235 @@
+"""Bulk-load synthetic users, doctors, appointments and feedback for benchmarking.
+
+    python generate_data.py --doctors 100000 --patients 500000 \
+        --appointments 10000000 --feedback 2000000
+
+Rows go in with batched multi-row INSERTs and explicit ids, one transaction
+per batch, so memory stays flat whatever the size. Every generated account
+uses the same password (``--password``), hashed once. Point it at another
+database with ``--database-url`` (e.g. ``sqlite:////tmp/bench.db``) and add
+``--create-schema`` when the tables do not exist yet.
+"""
+import argparse
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+SPECIALIZATIONS = ['Cardiology', 'Pediatrics', 'Dermatology', 'Orthopedics', 'Psychiatry', 'Neurology',
+                   'Gynecology', 'Ophthalmology', 'ENT', 'General Medicine', 'Oncology', 'Urology']
+CITIES = ['Mumbai', 'Delhi', 'Bangalore', 'Chennai', 'Pune', 'Hyderabad', 'Kolkata', 'Ahmedabad',
+          'Jaipur', 'Lucknow']
+FIRST_NAMES = ['John', 'Emily', 'Ravi', 'Asha', 'Karan', 'Priya', 'Michael', 'Sarah', 'Arjun', 'Neha',
+               'Vikram', 'Anita', 'Rahul', 'Meera', 'David', 'Fatima']
+LAST_NAMES = ['Smith', 'Sharma', 'Patel', 'Iyer', 'Khan', 'Jones', 'Reddy', 'Gupta', 'Brown', 'Das']
+BIOS = ['Experienced {spec} specialist focused on preventive care.',
+        'Treats common and complex {spec} conditions with {years} years of practice.',
+        'Consultant in {spec}; special interest in chronic disease management.']
+VISIT_MASKS = [1, 2, 3]  # models.VISIT_MODES: clinic, online, both
+# Weekday slot starts matching Config.DEFAULT_AVAILABILITY at 30-minute slots
+DAY_SLOTS = [datetime.strptime(f'{h:02d}:{m:02d}', '%H:%M').time()
+             for h in list(range(9, 13)) + list(range(14, 17)) for m in (0, 30)]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--doctors', type=int, default=200)
+    parser.add_argument('--appointments', type=int, default=10000)
+    parser.add_argument('--feedback', type=int, default=2000)
+    parser.add_argument('--history-days', type=int, default=180,
+                        help='Appointments start this many days in the past.')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--password', default='bench123')
+    parser.add_argument('--database-url', help='Overrides DATABASE_URL.')
+    parser.add_argument('--create-schema', action='store_true', help='Create missing tables first.')
+    return parser.parse_args()
+
+
+def batched(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def business_day(start, index):
+    """The index-th Monday-Friday date on or after start."""
+    while start.weekday() >= 5:
+        start += timedelta(days=1)
+    weeks, rest = divmod(index, 5)
+    day = start + timedelta(weeks=weeks)
+    for _ in range(rest):
+        day += timedelta(days=3 if day.weekday() == 4 else 1)
+    return day
+
+
+class Generator:
+    def __init__(self, db, args):
+        self.db = db
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.now = datetime.utcnow()
+
+    def next_id(self, table):
+        from sqlalchemy import func, select
+        return (self.db.session.execute(select(func.max(table.c.id))).scalar() or 0) + 1
+
+    def insert(self, table, rows, label):
+        started = time.perf_counter()
+        count = 0
+        for batch in batched(rows, self.args.batch_size):
+            with self.db.engine.begin() as conn:
+                conn.execute(table.insert(), batch)
+            count += len(batch)
+        elapsed = time.perf_counter() - started
+        print(f'{label:>18}: {count:>10} rows in {elapsed:7.1f}s ({count / elapsed if elapsed else 0:,.0f}/s)')
+        return count
+
+    def run(self):
+        from werkzeug.security import generate_password_hash
+        from models import User, Doctor, Appointment, SlotReservation, Feedback, UserRole
+        from sqlalchemy import bindparam, update
+        from rollups import rebuild_rollups
+        args = self.args
+        password_hash = generate_password_hash(args.password)
+        users, doctors = User.__table__, Doctor.__table__
+        first_user = self.next_id(users)
+        first_doctor = self.next_id(doctors)
+        first_appt = self.next_id(Appointment.__table__)
+        run = f'{args.seed}-{first_user}'
+        # Patients first, then one login per doctor
+        patient_ids = range(first_user, first_user + args.patients)
+        doctor_user_ids = range(first_user + args.patients, first_user + args.patients + args.doctors)
+        doctor_ids = range(first_doctor, first_doctor + args.doctors)
+
+        def user_rows():
+            for i, user_id in enumerate(patient_ids):
+                yield {'id': user_id, 'username': f'patient{i}_{run}', 'email': f'patient{i}_{run}@bench.test',
+                       'password_hash': password_hash, 'role': UserRole.PATIENT,
+                       'contact': f'9{user_id:09d}'[-10:], 'city': self.rng.choice(CITIES)}
+            for i, user_id in enumerate(doctor_user_ids):
+                yield {'id': user_id, 'username': f'doctor{i}_{run}', 'email': f'doctor{i}_{run}@bench.test',
+                       'password_hash': password_hash, 'role': UserRole.DOCTOR,
+                       'contact': f'8{user_id:09d}'[-10:], 'city': None}
+
+        def doctor_rows():
+            for user_id, doctor_id in zip(doctor_user_ids, doctor_ids):
+                spec = self.rng.choice(SPECIALIZATIONS)
+                yield {'id': doctor_id, 'user_id': user_id,
+                       'name': f'Dr. {self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}',
+                       'degree': 'MBBS, MD', 'specialization': spec,
+                       'bio': self.rng.choice(BIOS).format(spec=spec.lower(), years=self.rng.randint(2, 30)),
+                       'fees': float(self.rng.randint(3, 40) * 100), 'rating': 0.0,
+                       'rating_sum': 0, 'rating_count': 0, 'location': self.rng.choice(CITIES),
+                       'contact_info': None, 'verified': self.rng.random() < 0.95,
+                       'visit_mask': self.rng.choice(VISIT_MASKS), 'availability': None,
+                       'created_at': self.now - timedelta(minutes=self.rng.randint(0, 525600))}
+
+        reservations = []
+
+        def appointment_rows():
+            # The k-th appointment of a doctor gets the k-th weekday slot from the
+            # start date, so active appointments never collide on a reservation
+            start = date.today() - timedelta(days=args.history_days)
+            today = date.today()
+            per_day = len(DAY_SLOTS)
+            for k in range(args.appointments):
+                appt_id = first_appt + k
+                doctor_id = doctor_ids[k % args.doctors]
+                nth = k // args.doctors
+                day = business_day(start, nth // per_day)
+                slot = DAY_SLOTS[nth % per_day]
+                roll = self.rng.random()
+                if day < today:
+                    status = 'cancelled' if roll < 0.1 else 'confirmed'
+                else:
+                    status = 'cancelled' if roll < 0.05 else 'pending' if roll < 0.6 else 'confirmed'
+                if status != 'cancelled':
+                    reservations.append({'doctor_id': doctor_id, 'date': day, 'time': slot,
+                                         'appointment_id': appt_id, 'created_at': self.now})
+                yield {'id': appt_id, 'doctor_id': doctor_id,
+                       'patient_id': patient_ids[self.rng.randrange(args.patients)],
+                       'date': day, 'time': slot, 'visit_type': self.rng.choice(('clinic', 'online')),
+                       'notes': None, 'status': status, 'reschedule_count': 0,
+                       'doctor_response': 'accept' if status == 'confirmed' else None,
+                       'created_at': self.now}
+
+        def insert_appointments():
+            # Reservations reference appointments, so each batch carries its own
+            started = time.perf_counter()
+            appts = reserved = 0
+            for batch in batched(appointment_rows(), args.batch_size):
+                with self.db.engine.begin() as conn:
+                    conn.execute(Appointment.__table__.insert(), batch)
+                    if reservations:
+                        conn.execute(SlotReservation.__table__.insert(), reservations)
+                appts += len(batch)
+                reserved += len(reservations)
+                reservations.clear()
+            elapsed = time.perf_counter() - started
+            print(f'{"appointments":>18}: {appts:>10} rows in {elapsed:7.1f}s '
+                  f'({appts / elapsed if elapsed else 0:,.0f}/s, +{reserved} slot reservations)')
+
+        rating_sums = [0] * args.doctors
+        rating_counts = [0] * args.doctors
+
+        def feedback_rows():
+            # Patient u rates doctors u, u+1, ... so (user, doctor) pairs stay unique
+            for k in range(min(args.feedback, args.patients * args.doctors)):
+                u, round_ = k % args.patients, k // args.patients
+                d = (u + round_) % args.doctors
+                rating = self.rng.choice((1, 2, 3, 3, 4, 4, 4, 5, 5, 5))
+                rating_sums[d] += rating
+                rating_counts[d] += 1
+                yield {'user_id': patient_ids[u], 'doctor_id': doctor_ids[d], 'rating': rating,
+                       'comment': None, 'created_at': self.now}
+
+        def rating_rows():
+            # Same aggregates ratings.recompute_ratings() would derive, without rescanning feedbacks
+            for d, count in enumerate(rating_counts):
+                if count:
+                    yield {'doctor': doctor_ids[d], 'sum': rating_sums[d], 'count': count,
+                           'avg': rating_sums[d] / count}
+
+        self.insert(users, user_rows(), 'users')
+        self.insert(doctors, doctor_rows(), 'doctors')
+        if args.doctors and args.patients:
+            insert_appointments()
+            self.insert(Feedback.__table__, feedback_rows(), 'feedback')
+            rate = (update(doctors).where(doctors.c.id == bindparam('doctor'))
+                    .values(rating_sum=bindparam('sum'), rating_count=bindparam('count'),
+                            rating=bindparam('avg')))
+            started = time.perf_counter()
+            rated = 0
+            for batch in batched(rating_rows(), args.batch_size):
+                with self.db.engine.begin() as conn:
+                    conn.execute(rate, batch)
+                rated += len(batch)
+            print(f'{"ratings":>18}: {rated:>10} doctors in {time.perf_counter() - started:7.1f}s')
+            # Core inserts bypass the Appointment hooks, so derive the rollups in SQL
+            started = time.perf_counter()
+            rolled = rebuild_rollups()
+            print(f'{"rollups":>18}: {rolled:>10} doctors in {time.perf_counter() - started:7.1f}s')
+        print(f'Accounts: patient<i>_{run} / doctor<i>_{run}, password {args.password!r}')
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    from app import app
+    from models import db
+    with app.app_context():
+        if args.create_schema:
+            db.create_all(bind_key=None)
+        Generator(db, args).run()
+
+
+if __name__ == '__main__':
+    main()
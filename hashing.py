@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+class HasherBusy(Exception):
+    """The hashing pool is saturated; the caller should retry later."""
+
+    def __init__(self, retry_after):
+        super().__init__('password hashing is saturated')
+        self.retry_after = retry_after
+
+
+def _timed(func, *args):
+    # Runs in the pool process; the start time lets the caller split queue wait from hashing
+    started = time.time()
+    result = func(*args)
+    return started, result, time.time() - started
+
+
+class PasswordHasher:
+    """pbkdf2 hashing and checking on a bounded process pool.
+
+    At most ``max_pending`` jobs may be queued or running; further callers get
+    HasherBusy straight away instead of tying up request threads on CPU. A job
+    that does not finish within ``timeout`` seconds also raises HasherBusy.
+    ``workers=0`` hashes inline on the calling thread (still admission-limited).
+    """
+
+    def __init__(self, workers=2, max_pending=16, timeout=5.0):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pid = None
+        self.pending = 0
+        self.calls = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.hash_seconds = 0.0
+        self.hash_seconds_max = 0.0
+        self.wait_seconds = 0.0
+        self.wait_seconds_max = 0.0
+
+    def _executor(self):
+        # Pools do not survive a fork, so each server worker starts its own lazily.
+        # Children come from a forkserver (spawn where that is missing): forking
+        # this multithreaded process could copy locks other threads hold.
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(method))
+                self._pid = os.getpid()
+            return self._pool
+
+    def _record(self, submitted, started, elapsed):
+        wait = max(0.0, started - submitted)
+        with self._lock:
+            self.calls += 1
+            self.hash_seconds += elapsed
+            self.hash_seconds_max = max(self.hash_seconds_max, elapsed)
+            self.wait_seconds += wait
+            self.wait_seconds_max = max(self.wait_seconds_max, wait)
+
+    def _finished(self, future=None):
+        with self._lock:
+            self.pending -= 1
+        self._slots.release()
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy(retry_after=max(1, round(self.timeout)))
+        with self._lock:
+            self.pending += 1
+        submitted = time.time()
+        if not self.workers:
+            try:
+                started, result, elapsed = _timed(func, *args)
+            finally:
+                self._finished()
+            self._record(submitted, started, elapsed)
+            return result
+        try:
+            future = self._executor().submit(_timed, func, *args)
+        except Exception:
+            self._finished()
+            raise
+        # The slot is held until the job really leaves the pool, even if we stop waiting
+        future.add_done_callback(self._finished)
+        try:
+            started, result, elapsed = future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+            raise HasherBusy(retry_after=max(1, round(self.timeout)))
+        self._record(submitted, started, elapsed)
+        return result
+
+    def generate(self, password):
+        return self._run(generate_password_hash, password)
+
+    def check(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def stats(self):
+        with self._lock:
+            return {'workers': self.workers, 'max_pending': self.max_pending, 'pending': self.pending,
+                    'calls': self.calls, 'rejected': self.rejected, 'timeouts': self.timeouts,
+                    'hash_seconds_total': round(self.hash_seconds, 6),
+                    'hash_seconds_max': round(self.hash_seconds_max, 6),
+                    'wait_seconds_total': round(self.wait_seconds, 6),
+                    'wait_seconds_max': round(self.wait_seconds_max, 6)}
@@ -0,0 +1,53 @@
+import hashlib
+import json
+from datetime import datetime
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from werkzeug.http import is_resource_modified
+
+
+def shareable():
+    """Whether this response may be cached by browsers and shared caches.
+
+    Only anonymous GETs qualify: signed-in pages carry the user's name, CSRF
+    tokens and flashed messages, none of which a validator can see.
+    """
+    return (request.method in ('GET', 'HEAD') and not current_user.is_authenticated
+            and '_flashes' not in session)
+
+
+def page_etag(kind, page, *extra):
+    """Validator for a cached directory page dict, built from its doctors' ids and versions.
+
+    Nothing is rendered: the page dicts already carry ``updated_at``.
+    """
+    parts = [kind, page['next'], page['prev'], extra,
+             [(doc['id'], doc.get('updated_at'), doc.get('free_at')) for doc in page['items']]]
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()
+
+
+def last_modified(doc):
+    return datetime.fromisoformat(doc['updated_at']) if doc.get('updated_at') else None
+
+
+def conditional(render, etag=None, modified=None):
+    """Answer 304 when the request's validators still match, otherwise ``render()``.
+
+    With no ``etag`` the response is marked private and sent as before.
+    """
+    if etag is None:
+        response = make_response(render())
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    if not is_resource_modified(request.environ, etag=etag, last_modified=modified):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    if modified is not None:
+        response.last_modified = modified
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['PUBLIC_CACHE_MAX_AGE']
+    response.vary.add('Cookie')
+    return response
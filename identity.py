@@ -0,0 +1,40 @@
+from collections import namedtuple
+from flask_login import UserMixin
+from models import db, User, Doctor, UserRole
+
+DoctorSnapshot = namedtuple('DoctorSnapshot', 'id name specialization verified')
+
+
+class UserSnapshot(UserMixin):
+    """Read-only stand-in for User that Flask-Login keeps as current_user.
+
+    It carries only what request handling and templates read on every page.
+    Routes that need to modify the account must load the User row themselves.
+    """
+
+    __slots__ = ('id', 'username', 'role', 'doctor_profile')
+
+    def __init__(self, id, username, role, doctor_profile=None):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.doctor_profile = doctor_profile
+
+    @property
+    def is_admin(self):
+        return self.role == UserRole.ADMIN
+
+
+def load_snapshot(user_id):
+    """Build a UserSnapshot from one row tuple, or None if the user is gone."""
+    row = (db.session.query(User.id, User.username, User.role,
+                            Doctor.id.label('doctor_id'), Doctor.name,
+                            Doctor.specialization, Doctor.verified)
+           .outerjoin(Doctor, Doctor.user_id == User.id)
+           .filter(User.id == user_id).first())
+    if row is None:
+        return None
+    profile = None
+    if row.doctor_id is not None:
+        profile = DoctorSnapshot(row.doctor_id, row.name, row.specialization, bool(row.verified))
+    return UserSnapshot(row.id, row.username, row.role, profile)
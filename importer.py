@@ -0,0 +1,229 @@
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
+from werkzeug.security import generate_password_hash
+from models import db, User, Doctor, ImportCheckpoint, UserRole, VISIT_MODES
+from forms import DoctorForm, DoctorRegisterForm
+
+DOCTOR_FIELDS = ('name', 'degree', 'specialization', 'bio', 'fees', 'location', 'contact_info', 'visit_types')
+# Doctor columns written per row; the visit_types choice is stored as visit_mask
+DOCTOR_COLUMNS = DOCTOR_FIELDS[:-1] + ('visit_mask',)
+
+
+def read_rows(path, fmt=None):
+    """Yield (row number, dict or error message) from a CSV or NDJSON file, one line at a time."""
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+    with open(path, newline='' if fmt == 'csv' else None, encoding='utf-8') as f:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(f), start=1):
+                yield number, {k.strip(): v for k, v in row.items() if k}
+            return
+        for number, line in enumerate(f, start=1):
+            if not line.strip():
+                yield number, 'empty line'
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield number, f'invalid JSON: {e}'
+                continue
+            yield number, row if isinstance(row, dict) else 'expected a JSON object'
+
+
+def validate(row):
+    """Check a row with the same form the web UI uses; returns (clean data, errors).
+
+    Rows carrying a username create a doctor login too and are checked like
+    doctor self-registration; a ready-made ``password_hash`` may replace the
+    password. Other rows are checked like the admin "add doctor" form.
+    """
+    values = {k: str(v) for k, v in row.items() if v is not None and v != ''}
+    has_account = 'username' in values
+    if has_account:
+        values.setdefault('confirm_password', values.get('password', ''))
+        form = DoctorRegisterForm(formdata=MultiDict(values), meta={'csrf': False})
+        if values.get('password_hash'):
+            del form.password
+            del form.confirm_password
+    else:
+        form = DoctorForm(formdata=MultiDict(values), meta={'csrf': False})
+    if not form.validate():
+        return None, form.errors
+    data = {field: form[field].data for field in DOCTOR_FIELDS}
+    data['fees'] = data['fees'] or 0.0
+    data['visit_mask'] = int(VISIT_MODES[data.pop('visit_types')])
+    if has_account:
+        data.update(username=form.username.data, email=form.email.data, contact=form.contact.data,
+                    password=values.get('password'), password_hash=values.get('password_hash'))
+    return data, None
+
+
+class Checkpoint:
+    """Rows already committed for one input file, so an interrupted import can resume.
+
+    Stored in import_checkpoints and saved inside each batch's transaction, so
+    the batch and the checkpoint commit or roll back together.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.source = hashlib.sha1(self.path.encode()).hexdigest()
+        # Written by earlier versions, after the batch had committed
+        self.legacy_path = path + '.progress'
+
+    def load(self):
+        row = db.session.get(ImportCheckpoint, self.source)
+        if row is not None:
+            return row.rows_done
+        try:
+            with open(self.legacy_path) as f:
+                return json.load(f)['rows_done']
+        except (OSError, ValueError, KeyError):
+            return 0
+
+    def save(self, rows_done):
+        """Record progress in the current transaction; the caller commits."""
+        db.session.merge(ImportCheckpoint(source=self.source, path=self.path, rows_done=rows_done))
+
+    def clear(self):
+        db.session.query(ImportCheckpoint).filter_by(source=self.source).delete()
+        db.session.commit()
+        if os.path.exists(self.legacy_path):
+            os.remove(self.legacy_path)
+
+
+class DoctorImporter:
+    """Stream doctors (optionally with logins) into the database in batches.
+
+    Each batch is one transaction: users go in with one executemany, their
+    ids come back with one SELECT on username, then the doctors go in with
+    another executemany, and the checkpoint is advanced. Bad rows are written
+    to ``errors`` and skipped; that includes rows the database itself rejects,
+    found by retrying a failed batch one row at a time.
+    """
+
+    def __init__(self, batch_size=1000, verified=True, errors=None, echo=print):
+        self.batch_size = batch_size
+        self.verified = verified
+        self.errors = errors
+        self.echo = echo
+        self.stats = {'read': 0, 'imported': 0, 'failed': 0, 'skipped': 0}
+        self._seen_usernames = set()
+        self._seen_emails = set()
+
+    def reject(self, number, errors, row=None):
+        self.stats['failed'] += 1
+        if self.errors is not None:
+            self.errors.write(json.dumps({'row': number, 'errors': errors, 'data': row}, default=str) + '\n')
+
+    def run(self, path, fmt=None, resume=True):
+        checkpoint = Checkpoint(path)
+        start = checkpoint.load() if resume else 0
+        if start:
+            self.echo(f'Resuming after row {start}.')
+        batch = []
+        last = start
+        with ProcessPoolExecutor() as pool:
+            for number, row in read_rows(path, fmt):
+                if number <= start:
+                    self.stats['skipped'] += 1
+                    continue
+                self.stats['read'] += 1
+                last = number
+                if isinstance(row, str):
+                    self.reject(number, {'row': [row]})
+                    continue
+                data, errors = validate(row)
+                if errors:
+                    self.reject(number, errors, row)
+                    continue
+                batch.append((number, data, row))
+                if len(batch) >= self.batch_size:
+                    self.flush(batch, pool, checkpoint, last)
+                    batch = []
+            self.flush(batch, pool, checkpoint, last)
+        checkpoint.clear()
+        return self.stats
+
+    def flush(self, batch, pool, checkpoint=None, rows_done=None):
+        """Insert one batch and advance the checkpoint to ``rows_done`` in a single transaction."""
+        batch = self.dedupe(batch)
+        imported = 0
+        if batch:
+            accounts = [data for _, data, _ in batch if data.get('username')]
+            # pbkdf2 is the slow part of an import; spread it over every core
+            plain = [data for data in accounts if not data['password_hash']]
+            for data, hashed in zip(plain, pool.map(generate_password_hash, [d['password'] for d in plain],
+                                                    chunksize=16)):
+                data['password_hash'] = hashed
+            try:
+                with db.session.begin_nested():
+                    self.insert(batch)
+                imported = len(batch)
+            except IntegrityError:
+                # A constraint the checks above cannot see; find the offending rows
+                imported = self.insert_each(batch)
+        if checkpoint is not None:
+            checkpoint.save(rows_done)
+        db.session.commit()
+        self.stats['imported'] += imported
+        if batch:
+            self.echo(f'{self.stats["imported"]} imported, {self.stats["failed"]} rejected')
+
+    def insert_each(self, batch):
+        """Insert rows one savepoint at a time, rejecting those the database refuses."""
+        imported = 0
+        for number, data, row in batch:
+            try:
+                with db.session.begin_nested():
+                    self.insert([(number, data, row)])
+            except IntegrityError as e:
+                self.reject(number, {'database': [str(e.orig)]}, row)
+            else:
+                imported += 1
+        return imported
+
+    def insert(self, batch):
+        accounts = [data for _, data, _ in batch if data.get('username')]
+        ids = {}
+        if accounts:
+            db.session.execute(insert(User), [
+                {'username': d['username'], 'email': d['email'], 'contact': d['contact'],
+                 'password_hash': d['password_hash'], 'role': UserRole.DOCTOR} for d in accounts])
+            ids = dict(db.session.execute(select(User.username, User.id).where(
+                User.username.in_([d['username'] for d in accounts]))).all())
+        db.session.execute(insert(Doctor), [
+            dict({column: data[column] for column in DOCTOR_COLUMNS},
+                 user_id=ids[data['username']] if data.get('username') else None, verified=self.verified)
+            for _, data, _ in batch])
+
+    def dedupe(self, batch):
+        """Drop rows whose username/email is taken, in the database or earlier in the file."""
+        accounts = [data for _, data, _ in batch if data.get('username')]
+        if not accounts:
+            return batch
+        taken = db.session.execute(select(User.username, User.email).where(
+            User.username.in_([d['username'] for d in accounts]) | User.email.in_([d['email'] for d in accounts])
+        )).all()
+        taken_usernames = {r.username for r in taken} | self._seen_usernames
+        taken_emails = {r.email for r in taken} | self._seen_emails
+        kept = []
+        for number, data, row in batch:
+            if data.get('username'):
+                if data['username'] in taken_usernames:
+                    self.reject(number, {'username': ['Username already taken']}, row)
+                    continue
+                if data['email'] in taken_emails:
+                    self.reject(number, {'email': ['Email already registered']}, row)
+                    continue
+                taken_usernames.add(data['username'])
+                taken_emails.add(data['email'])
+                self._seen_usernames.add(data['username'])
+                self._seen_emails.add(data['email'])
+            kept.append((number, data, row))
+        return kept
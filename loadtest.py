@@ -0,0 +1,271 @@
+"""Drive a realistic request mix and report latency, throughput and SQL per request.
+
+    python loadtest.py --requests 2000 --concurrency 4 --save benchmarks/local.json
+    python loadtest.py --requests 2000 --concurrency 4 --compare benchmarks/local.json
+
+By default requests go through the Flask test client in this process, which
+also lets every request's SQL statements be counted. ``--url`` sends them to
+a running server over HTTP instead (no SQL counts). Accounts come from
+generate_data.py (``@bench.test`` emails); run it against a throwaway
+database because the ``book`` operation creates appointments. The operation
+sequence is fixed by ``--seed``, so runs with the same data are comparable.
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from generate_data import CITIES, SPECIALIZATIONS
+
+DEFAULT_MIX = 'index=30,search=30,book=10,my_appointments=15,doctor_dashboard=15'
+SEARCH_TERMS = ['heart', 'child', 'skin', 'chronic', 'preventive', 'smith', 'priya']
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=1000, help='Timed requests in total.')
+    parser.add_argument('--warmup', type=int, default=50, help='Untimed requests per worker first.')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Comma-separated op=weight pairs.')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--password', default='bench123')
+    parser.add_argument('--url', help='Base URL of a running server, e.g. http://127.0.0.1:5000')
+    parser.add_argument('--database-url', help='Overrides DATABASE_URL.')
+    parser.add_argument('--save', help='Write the results to this JSON file as a baseline.')
+    parser.add_argument('--compare', help='Compare against a saved baseline; exit 1 on regression.')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed relative p95 slowdown before --compare fails.')
+    return parser.parse_args()
+
+
+# --- Clients ---
+class TestClient:
+    """In-process client; SQL statements are counted per thread."""
+    counter = threading.local()
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    @classmethod
+    def count_sql(cls, db, app):
+        def before_cursor_execute(*args, **kwargs):
+            cls.counter.sql = getattr(cls.counter, 'sql', 0) + 1
+        from sqlalchemy import event
+        with app.app_context():
+            for engine in set(db.engines.values()):
+                event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+
+    def request(self, method, path, payload=None):
+        self.counter.sql = 0
+        response = self.client.open(path, method=method, json=payload)
+        return response.status_code, response.get_data(), self.counter.sql
+
+
+class HttpClient:
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def request(self, method, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        if data is not None:
+            req.add_header('Content-Type', 'application/json')
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                return response.status, response.read(), None
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), None
+        except OSError as e:
+            # Refused/reset connections and timeouts count as server errors
+            return 599, str(e).encode(), None
+
+
+# --- Workload ---
+class Worker:
+    def __init__(self, index, args, accounts, make_client):
+        self.rng = random.Random(args.seed * 1000 + index)
+        self.accounts = accounts
+        self.patient = make_client()
+        self.doctor = make_client()
+        self.results = []
+        self.login(self.patient, self.rng.choice(accounts['patients']), args.password)
+        self.login(self.doctor, self.rng.choice(accounts['doctors']), args.password)
+
+    @staticmethod
+    def login(client, username, password):
+        status, body, _ = client.request('POST', '/api/v1/login', {'username': username, 'password': password})
+        if status != 200:
+            raise SystemExit(f'Login failed for {username}: {status} {body[:200]!r}')
+
+    def op_index(self):
+        return [self.patient.request('GET', '/')]
+
+    def op_search(self):
+        params = {'specialization': self.rng.choice(SPECIALIZATIONS), 'city': self.rng.choice(CITIES)}
+        if self.rng.random() < 0.3:
+            params = {'q': self.rng.choice(SEARCH_TERMS)}
+        return [self.patient.request('GET', '/search?' + urllib.parse.urlencode(params))]
+
+    def op_book(self):
+        doc_id = self.rng.choice(self.accounts['doctor_ids'])
+        lookup = self.patient.request('GET', f'/api/v1/doctors/{doc_id}/availability?next=5')
+        if lookup[0] != 200:
+            return [lookup]
+        slots = json.loads(lookup[1])['slots']
+        if not slots:
+            return [lookup]
+        slot = self.rng.choice(slots)
+        return [lookup, self.patient.request('POST', '/api/v1/appointments',
+                                             {'doctor_id': doc_id, 'date': slot['date'],
+                                              'time': slot['time'], 'notes': 'load test'})]
+
+    def op_my_appointments(self):
+        return [self.patient.request('GET', '/my_appointments')]
+
+    def op_doctor_dashboard(self):
+        return [self.doctor.request('GET', '/doctor_dashboard')]
+
+    def run(self, ops, weights, count, warmup):
+        for i in range(warmup + count):
+            op = self.rng.choices(ops, weights)[0]
+            started = time.perf_counter()
+            responses = getattr(self, 'op_' + op)()
+            elapsed = time.perf_counter() - started
+            if i >= warmup:
+                statuses = [r[0] for r in responses]
+                sql = None if responses[-1][2] is None else sum(r[2] for r in responses)
+                self.results.append((op, elapsed, max(statuses), sql))
+
+
+def load_accounts(app, db, limit=2000):
+    from models import User, Doctor, UserRole
+    with app.app_context():
+        bench = User.email.like('%@bench.test')
+        patients = [r.username for r in db.session.query(User.username)
+                    .filter(bench, User.role == UserRole.PATIENT).order_by(User.id).limit(limit)]
+        doctors = db.session.query(User.username, Doctor.id).join(Doctor, Doctor.user_id == User.id).filter(
+            bench, Doctor.verified.is_(True)).order_by(Doctor.id).limit(limit).all()
+    if not patients or not doctors:
+        raise SystemExit('No benchmark accounts found; run generate_data.py first.')
+    return {'patients': patients, 'doctors': [r.username for r in doctors],
+            'doctor_ids': [r.id for r in doctors]}
+
+
+# --- Reporting ---
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(results, wall_seconds):
+    ops = {}
+    for op in sorted({r[0] for r in results}):
+        rows = [r for r in results if r[0] == op]
+        latencies = [r[1] * 1000 for r in rows]
+        sql = [r[3] for r in rows if r[3] is not None]
+        ops[op] = {'count': len(rows),
+                   'errors': sum(1 for r in rows if r[2] >= 500),
+                   'rejected': sum(1 for r in rows if 400 <= r[2] < 500),
+                   'p50_ms': round(percentile(latencies, 50), 2),
+                   'p95_ms': round(percentile(latencies, 95), 2),
+                   'p99_ms': round(percentile(latencies, 99), 2),
+                   'sql_per_request': round(sum(sql) / len(sql), 2) if sql else None}
+    return {'ops': ops, 'requests': len(results), 'seconds': round(wall_seconds, 3),
+            'throughput_rps': round(len(results) / wall_seconds, 1) if wall_seconds else None}
+
+
+def print_report(summary):
+    print(f'{"op":<18}{"count":>7}{"5xx":>6}{"4xx":>6}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"sql/req":>9}')
+    for op, s in summary['ops'].items():
+        sql = '-' if s['sql_per_request'] is None else f'{s["sql_per_request"]:.1f}'
+        print(f'{op:<18}{s["count"]:>7}{s["errors"]:>6}{s["rejected"]:>6}'
+              f'{s["p50_ms"]:>10.1f}{s["p95_ms"]:>10.1f}{s["p99_ms"]:>10.1f}{sql:>9}')
+    print(f'{summary["requests"]} requests in {summary["seconds"]:.1f}s, {summary["throughput_rps"]} req/s')
+
+
+def compare(summary, baseline, tolerance):
+    """Print per-op changes against a baseline; return True if anything regressed."""
+    regressed = False
+    print(f'\nAgainst baseline from {baseline["meta"]["recorded_at"]}:')
+    for op, s in summary['ops'].items():
+        base = baseline['ops'].get(op)
+        if base is None:
+            continue
+        change = (s['p95_ms'] - base['p95_ms']) / base['p95_ms'] if base['p95_ms'] else 0.0
+        notes = []
+        if change > tolerance:
+            notes.append('p95 REGRESSION')
+        if s['sql_per_request'] is not None and base['sql_per_request'] is not None \
+                and s['sql_per_request'] > base['sql_per_request'] + 0.5:
+            notes.append('more SQL')
+        regressed = regressed or bool(notes)
+        print(f'  {op:<18} p95 {base["p95_ms"]:>8.1f} -> {s["p95_ms"]:>8.1f} ms ({change:+.0%})'
+              f'  sql {base["sql_per_request"]} -> {s["sql_per_request"]}  {" ".join(notes)}')
+    base_rps, rps = baseline.get('throughput_rps'), summary['throughput_rps']
+    if base_rps and rps:
+        print(f'  throughput {base_rps} -> {rps} req/s ({(rps - base_rps) / base_rps:+.0%})')
+    return regressed
+
+
+def main():
+    args = parse_args()
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    from app import app
+    from models import db
+    mix = dict(part.split('=') for part in args.mix.split(','))
+    ops, weights = list(mix), [float(w) for w in mix.values()]
+    unknown = [op for op in ops if not hasattr(Worker, 'op_' + op)]
+    if unknown:
+        raise SystemExit(f'Unknown operations in --mix: {", ".join(unknown)}')
+    accounts = load_accounts(app, db)
+    if args.url:
+        make_client = lambda: HttpClient(args.url)
+    else:
+        TestClient.count_sql(db, app)
+        make_client = lambda: TestClient(app)
+
+    workers = [Worker(i, args, accounts, make_client) for i in range(args.concurrency)]
+    per_worker = [args.requests // args.concurrency + (i < args.requests % args.concurrency)
+                  for i in range(args.concurrency)]
+    threads = [threading.Thread(target=w.run, args=(ops, weights, n, args.warmup))
+               for w, n in zip(workers, per_worker)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    summary = summarize([r for w in workers for r in w.results], time.perf_counter() - started)
+    print_report(summary)
+
+    with app.app_context():
+        backend = db.engine.url.get_backend_name()
+    summary['meta'] = {'recorded_at': datetime.now().isoformat(timespec='seconds'),
+                       'target': args.url or 'test-client', 'mix': args.mix, 'seed': args.seed,
+                       'concurrency': args.concurrency, 'python': platform.python_version(),
+                       'database': backend}
+    regressed = False
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(summary, json.load(f), args.tolerance)
+    if args.save:
+        os.makedirs(os.path.dirname(args.save) or '.', exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f'Saved baseline to {args.save}')
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,160 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from flask import g, has_request_context, request
 
-def setup_logger():
-    """Set up the logger for the application."""
-    logger = logging.getLogger('clinic-app')
-    logger.setLevel(logging.INFO)
-    handler = logging.StreamHandler()
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    handler.setFormatter(formatter)
+LOGGER_NAME = 'clinic-app'
+CONTEXT_FIELDS = ('request_id', 'method', 'route', 'user_id', 'duration_ms')
+
+
+class RequestContextFilter(logging.Filter):
+    """Stamp records made while serving a request with its id, route, user and elapsed time.
+
+    Runs on the calling thread, which is the only place the request is visible.
+    """
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get('request_id')
+            record.method = request.method
+            record.route = request.url_rule.endpoint if request.url_rule else request.path
+            # Only read a user Flask-Login has already loaded; never trigger a lookup
+            user = g.get('_login_user')
+            record.user_id = getattr(user, 'id', None)
+            started = g.get('request_started')
+            record.duration_ms = round((time.perf_counter() - started) * 1000, 2) if started else None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only ``rate`` of INFO-and-below records; warnings and errors always pass."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+                 'level': record.levelname, 'logger': record.name, 'message': record.getMessage()}
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Already formatted by NonBlockingQueueHandler.prepare on the logging thread
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the writer thread without ever blocking the caller.
+
+    When the queue is full the record is dropped and counted. The writer
+    thread is restarted after a fork, since threads do not survive it.
+    """
+
+    def __init__(self, log_queue, handlers):
+        super().__init__(log_queue)
+        self.handlers = handlers
+        self.dropped = 0
+        self._pid = None
+        self._listener = None
+        self._lock = threading.Lock()
+        self.start()
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._listener = logging.handlers.QueueListener(self.queue, *self.handlers,
+                                                            respect_handler_level=True)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        with self._lock:
+            if self._listener is not None and self._pid == os.getpid():
+                self._listener.stop()
+            self._pid = None
+
+    def prepare(self, record):
+        # The JSON formatter runs on the writer thread; only resolve the message here.
+        # Tracebacks are kept apart in exc_text (exc_info does not survive the queue).
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self._pid != os.getpid():
+            self.start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logger(config=None):
+    """Set up the logger for the application.
+
+    Request threads only filter and enqueue; a background thread formats JSON
+    and writes to stderr and, if LOG_FILE is set, a rotating file. Calling it
+    again returns the already configured logger.
+    """
+    config = config or {}
+    logger = logging.getLogger(LOGGER_NAME)
+    if any(isinstance(h, NonBlockingQueueHandler) for h in logger.handlers):
+        return logger
+    logger.setLevel(config.get('LOG_LEVEL', 'INFO'))
+    logger.propagate = False
+
+    formatter = JsonFormatter()
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if config.get('LOG_FILE'):
+        handlers.append(logging.handlers.RotatingFileHandler(
+            config['LOG_FILE'], maxBytes=config.get('LOG_MAX_BYTES', 10 * 1024 * 1024),
+            backupCount=config.get('LOG_BACKUP_COUNT', 5), encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    handler = NonBlockingQueueHandler(queue.Queue(config.get('LOG_QUEUE_SIZE', 10000)), handlers)
+    handler.addFilter(SamplingFilter(config.get('LOG_INFO_SAMPLE_RATE', 1.0)))
+    handler.addFilter(RequestContextFilter())
     logger.addHandler(handler)
+    atexit.register(handler.stop)
     return logger
+
+
+def init_request_logging(app, logger):
+    """Give every request an id (honouring X-Request-ID) and log one line when it completes."""
+
+    @app.before_request
+    def start_request():
+        g.request_id = (request.headers.get('X-Request-ID') or '')[:64] or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def finish_request(response):
+        response.headers['X-Request-ID'] = g.get('request_id', '')
+        logger.info('%s %s %s', request.method, request.full_path.rstrip('?'), response.status_code)
+        return response
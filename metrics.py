@@ -0,0 +1,220 @@
+import re
+import threading
+import time
+from collections import defaultdict
+from flask import Response, abort, g, has_request_context, request
+from flask.signals import before_render_template, signals_available, template_rendered
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (512, 2048, 8192, 32768, 131072, 524288, 2097152)
+IN_LIST_RE = re.compile(r'\((?:\s*(?:\?|%s|%\(\w+\)s)\s*,)+\s*(?:\?|%s|%\(\w+\)s)\s*\)')
+SPACE_RE = re.compile(r'\s+')
+SELECT_LIST_RE = re.compile(r'^SELECT .+? FROM ')
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self.values[labels] += amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_labels(self.labels, labels)} {value:g}')
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus exposition format."""
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts = self.series.get(labels)
+            if counts is None:
+                counts = self.series[labels] = [[0] * len(self.buckets), 0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[0][i] += 1
+            counts[1] += 1
+            counts[2] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        names = self.labels + ('le',)
+        with self._lock:
+            for labels, (buckets, count, total) in sorted(self.series.items()):
+                for bound, n in zip(self.buckets, buckets):
+                    lines.append(f'{self.name}_bucket{_labels(names, labels + (f"{bound:g}",))} {n}')
+                lines.append(f'{self.name}_bucket{_labels(names, labels + ("+Inf",))} {count}')
+                lines.append(f'{self.name}_sum{_labels(self.labels, labels)} {total:g}')
+                lines.append(f'{self.name}_count{_labels(self.labels, labels)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.gauges = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name, help, labels, collect):
+        """Register a gauge read at scrape time; collect() returns {label values: number}."""
+        self.gauges.append((name, help, tuple(labels), collect))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for name, help, labels, collect in self.gauges:
+            lines += [f'# HELP {name} {help}', f'# TYPE {name} gauge']
+            for values, value in sorted(collect().items()):
+                lines.append(f'{name}{_labels(labels, values)} {float(value):g}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+requests_total = registry.counter('http_requests_total', 'Requests by endpoint, method and status.',
+                                  ('endpoint', 'method', 'status'))
+request_seconds = registry.histogram('http_request_duration_seconds', 'Request latency.',
+                                     ('endpoint', 'method'))
+response_bytes = registry.histogram('http_response_size_bytes', 'Response body size.',
+                                    ('endpoint',), buckets=SIZE_BUCKETS)
+sql_statements = registry.histogram('db_statements_per_request', 'SQL statements per request.',
+                                    ('endpoint',), buckets=COUNT_BUCKETS)
+sql_seconds = registry.histogram('db_time_per_request_seconds', 'Time spent in SQL per request.',
+                                 ('endpoint',))
+render_seconds = registry.histogram('template_render_seconds', 'Jinja render time per request.',
+                                    ('endpoint',))
+slow_requests = registry.counter('http_slow_requests_total', 'Requests slower than SLOW_REQUEST_MS.',
+                                 ('endpoint',))
+
+
+def fingerprint(statement):
+    """Statement text with whitespace, column lists and IN-lists collapsed, for grouping."""
+    text = SELECT_LIST_RE.sub('SELECT ... FROM ', SPACE_RE.sub(' ', statement).strip())
+    return IN_LIST_RE.sub('(?...)', text)[:300]
+
+
+def _current():
+    return g.get('_metrics') if has_request_context() else None
+
+
+def init_metrics(app, db, logger):
+    """Time every request, its SQL and its template rendering; serve /metrics."""
+    slow_ms = app.config['SLOW_REQUEST_MS']
+    token = app.config['METRICS_TOKEN']
+    public = app.config['METRICS_PUBLIC']
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        current = _current()
+        if current is not None:
+            started = getattr(context, '_metrics_started', None)
+            elapsed = time.perf_counter() - started if started is not None else 0.0
+            current['sql'] += 1
+            current['sql_seconds'] += elapsed
+            current['statements'].append((statement, elapsed))
+
+    with app.app_context():
+        for engine in set(db.engines.values()):
+            event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+
+    if signals_available:
+        def render_started(sender, template, context, **extra):
+            current = _current()
+            if current is not None:
+                current['render_started'].append(time.perf_counter())
+
+        def render_finished(sender, template, context, **extra):
+            current = _current()
+            if current is not None and current['render_started']:
+                current['render_seconds'] += time.perf_counter() - current['render_started'].pop()
+
+        before_render_template.connect(render_started, app, weak=False)
+        template_rendered.connect(render_finished, app, weak=False)
+    else:
+        logger.warning('blinker is not installed; template render time will read 0')
+
+    @app.before_request
+    def start_timer():
+        g._metrics = {'started': time.perf_counter(), 'sql': 0, 'sql_seconds': 0.0, 'statements': [],
+                      'render_started': [], 'render_seconds': 0.0}
+
+    @app.after_request
+    def record(response):
+        current = g.pop('_metrics', None)
+        if current is None:
+            return response
+        elapsed = time.perf_counter() - current['started']
+        # Unmatched URLs share one label so scanners cannot blow up the series count
+        endpoint = request.url_rule.endpoint if request.url_rule else '<unmatched>'
+        requests_total.inc(endpoint, request.method, str(response.status_code))
+        request_seconds.observe(elapsed, endpoint, request.method)
+        sql_statements.observe(current['sql'], endpoint)
+        sql_seconds.observe(current['sql_seconds'], endpoint)
+        render_seconds.observe(current['render_seconds'], endpoint)
+        if not response.is_streamed:
+            response_bytes.observe(response.calculate_content_length() or 0, endpoint)
+        if elapsed * 1000 >= slow_ms:
+            slow_requests.inc(endpoint)
+            log_slow_request(logger, endpoint, elapsed, current)
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        if token:
+            if request.headers.get('Authorization') != f'Bearer {token}':
+                abort(403)
+        elif not public:
+            abort(403)
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def log_slow_request(logger, endpoint, elapsed, current, top=5):
+    by_query = defaultdict(lambda: [0, 0.0])
+    for statement, seconds in current['statements']:
+        entry = by_query[fingerprint(statement)]
+        entry[0] += 1
+        entry[1] += seconds
+    worst = sorted(by_query.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    logger.warning('Slow request %s %s (%s): %.0f ms, %d SQL in %.0f ms, render %.0f ms; top queries: %s',
+                   request.method, request.path, endpoint, elapsed * 1000, current['sql'],
+                   current['sql_seconds'] * 1000, current['render_seconds'] * 1000,
+                   '; '.join(f'{n}x {ms * 1000:.1f} ms {fp}' for fp, (n, ms) in worst) or 'none')
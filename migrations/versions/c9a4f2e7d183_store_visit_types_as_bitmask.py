@@ -0,0 +1,49 @@
+"""Store doctor visit types as an indexed bitmask
+
+Revision ID: c9a4f2e7d183
+Revises: b3d7e5f90a26
+Create Date: 2026-10-19 00:21:37.905512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9a4f2e7d183'
+down_revision = 'b3d7e5f90a26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # recreate='never': plain ALTER TABLE ... DROP COLUMN (SQLite 3.35+), so SQLite does
+    # not copy doctors, which would cascade-delete its child rows inside this transaction
+    with op.batch_alter_table('doctors', schema=None, recreate='never') as batch_op:
+        batch_op.add_column(sa.Column('visit_mask', sa.SmallInteger(), server_default='1', nullable=False))
+        batch_op.create_index(batch_op.f('ix_doctors_visit_mask'), ['visit_mask'], unique=False)
+
+    # 1 = clinic, 2 = online (models.VisitType); rows without any fall back to clinic,
+    # the form default
+    op.execute(
+        "UPDATE doctors SET visit_mask = CASE "
+        "WHEN visit_types LIKE '%online%' AND visit_types LIKE '%clinic%' THEN 3 "
+        "WHEN visit_types LIKE '%online%' THEN 2 ELSE 1 END"
+    )
+
+    with op.batch_alter_table('doctors', schema=None, recreate='never') as batch_op:
+        batch_op.drop_column('visit_types')
+
+
+def downgrade():
+    with op.batch_alter_table('doctors', schema=None, recreate='never') as batch_op:
+        batch_op.add_column(sa.Column('visit_types', sa.Text(), nullable=True))
+
+    op.execute(
+        "UPDATE doctors SET visit_types = CASE visit_mask "
+        "WHEN 3 THEN '[\"clinic\", \"online\"]' WHEN 2 THEN '[\"online\"]' ELSE '[\"clinic\"]' END"
+    )
+
+    with op.batch_alter_table('doctors', schema=None, recreate='never') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_doctors_visit_mask'))
+        batch_op.drop_column('visit_mask')
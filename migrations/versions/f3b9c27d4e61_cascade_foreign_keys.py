@@ -0,0 +1,56 @@
+"""Name foreign keys and cascade deletes in the database
+
+Revision ID: f3b9c27d4e61
+Revises: e8f3a1c5d902
+Create Date: 2026-10-18 21:04:12.518230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b9c27d4e61'
+down_revision = 'e8f3a1c5d902'
+branch_labels = None
+depends_on = None
+
+# (table, column, referred table); constraint names follow fk_<table>_<column>_<referred>
+FOREIGN_KEYS = [
+    ('doctors', 'user_id', 'users'),
+    ('appointments', 'doctor_id', 'doctors'),
+    ('appointments', 'patient_id', 'users'),
+    ('slot_reservations', 'doctor_id', 'doctors'),
+    ('slot_reservations', 'appointment_id', 'appointments'),
+    ('feedbacks', 'user_id', 'users'),
+    ('feedbacks', 'doctor_id', 'doctors'),
+]
+# Lets batch mode (SQLite) address the originally unnamed constraints
+NAMING = {'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'}
+
+
+def _replace_foreign_keys(ondelete):
+    bind = op.get_bind()
+    sqlite = bind.dialect.name == 'sqlite'
+    if sqlite:
+        # Batch mode copies and drops each table; with enforcement on, the drop would cascade
+        op.execute('PRAGMA foreign_keys = OFF')
+    for table in dict.fromkeys(t for t, _, _ in FOREIGN_KEYS):
+        # MySQL generated names like appointments_ibfk_1 for the unnamed constraints
+        existing = {tuple(fk['constrained_columns']): fk['name']
+                    for fk in sa.inspect(bind).get_foreign_keys(table)}
+        with op.batch_alter_table(table, naming_convention=NAMING) as batch_op:
+            for _, column, referred in (fk for fk in FOREIGN_KEYS if fk[0] == table):
+                name = f'fk_{table}_{column}_{referred}'
+                batch_op.drop_constraint(existing.get((column,)) or name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+    if sqlite:
+        op.execute('PRAGMA foreign_keys = ON')
+
+
+def upgrade():
+    _replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    _replace_foreign_keys(None)
@@ -0,0 +1,48 @@
+"""Never reuse appointment ids
+
+Revision ID: f6a2c8e4d197
+Revises: e4b8d1a6c375
+Create Date: 2026-10-19 02:12:40.731958
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6a2c8e4d197'
+down_revision = 'e4b8d1a6c375'
+branch_labels = None
+depends_on = None
+
+# Highest id ever handed out, including appointments already moved to the archive
+MAX_ID = 'SELECT coalesce(max(id), 0) FROM (SELECT id FROM appointments UNION ALL SELECT id FROM appointments_archive) AS ids'
+
+
+def _rebuild_appointments(autoincrement):
+    # SQLite only takes AUTOINCREMENT in CREATE TABLE, so batch mode copies the table.
+    # Dropping the old copy would cascade to slot_reservations and appointment_events;
+    # PRAGMA foreign_keys is a no-op inside a transaction, so switch it outside one.
+    context = op.get_context()
+    with context.autocommit_block():
+        op.execute('PRAGMA foreign_keys = OFF')
+    with op.batch_alter_table('appointments', recreate='always',
+                              table_kwargs={'sqlite_autoincrement': autoincrement}) as batch_op:
+        pass
+    with context.autocommit_block():
+        op.execute('PRAGMA foreign_keys = ON')
+
+
+def upgrade():
+    # MySQL (8.0+ persists the counter) and PostgreSQL sequences never hand an id out twice
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    _rebuild_appointments(True)
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'appointments'")
+    op.execute(f"INSERT INTO sqlite_sequence (name, seq) SELECT 'appointments', ({MAX_ID})")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    _rebuild_appointments(False)
@@ -1,15 +1,25 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
-from enum import Enum
+from enum import Enum, IntFlag
+from routing import RoutingSession
 
-db = SQLAlchemy()
+# Reads during GET requests may be routed to a replica (see routing.py)
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class UserRole(Enum):
     PATIENT = 'patient'
     DOCTOR = 'doctor'
     ADMIN = 'admin'
 
+class VisitType(IntFlag):
+    # Bits of Doctor.visit_mask
+    CLINIC = 1
+    ONLINE = 2
+
+# Form choices ('clinic', 'online', 'both') -> visit_mask
+VISIT_MODES = {'clinic': VisitType.CLINIC, 'online': VisitType.ONLINE, 'both': VisitType.CLINIC | VisitType.ONLINE}
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
@@ -22,39 +32,80 @@ class User(UserMixin, db.Model):
     city = db.Column(db.String(100))
     dob = db.Column(db.Date)
 
-    appointments = db.relationship('Appointment', back_populates='patient')
-    feedbacks = db.relationship('Feedback', back_populates='user')
+    # Child rows are removed by ON DELETE CASCADE; the ORM never loads them to delete
+    appointments = db.relationship('Appointment', back_populates='patient', passive_deletes=True)
+    feedbacks = db.relationship('Feedback', back_populates='user', passive_deletes=True)
 
     @property
     def is_admin(self):
         return self.role == UserRole.ADMIN
 
+    def to_dict(self):
+        return {'id': self.id, 'username': self.username, 'email': self.email,
+                'contact': self.contact, 'role': self.role.value if self.role else None}
+
 class Doctor(db.Model):
     __tablename__ = 'doctors'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', name='fk_doctors_user_id_users', ondelete='CASCADE'),
+                        unique=True)
     name = db.Column(db.String(120), nullable=False)
     degree = db.Column(db.String(200))
     specialization = db.Column(db.String(200))
     bio = db.Column(db.Text)
     availability = db.Column(db.Text)  # JSON string for slots
     fees = db.Column(db.Float, default=0.0)
-    rating = db.Column(db.Float, default=0.0)
+    rating = db.Column(db.Float, default=0.0, index=True)  # maintained from feedbacks, see ratings.py
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     location = db.Column(db.String(100))  # city
     contact_info = db.Column(db.Text)  # email/phone
     verified = db.Column(db.Boolean, default=False)
-    visit_types = db.Column(db.Text)  # JSON: ['online', 'clinic']
+    visit_mask = db.Column(db.SmallInteger, nullable=False, default=VisitType.CLINIC, server_default='1',
+                           index=True)  # VisitType bits
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Also set by Core UPDATEs (approval, ratings); the directory's HTTP validators read it
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Collections stay lazy; list views pick their own eager options
+    appointments = db.relationship('Appointment', back_populates='doctor', passive_deletes=True)
+    feedbacks = db.relationship('Feedback', back_populates='doctor', passive_deletes=True)
+    user = db.relationship('User', backref=db.backref('doctor_profile', uselist=False, lazy='joined',
+                                                      passive_deletes=True))
+
+    __table_args__ = (
+        db.Index('ix_doctors_created_at_id', 'created_at', 'id'),
+    )
 
-    appointments = db.relationship('Appointment', back_populates='doctor')
-    feedbacks = db.relationship('Feedback', back_populates='doctor')
-    user = db.relationship('User', backref='doctor_profile')
+    @property
+    def visit_types(self):
+        return [flag.name.lower() for flag in VisitType if (self.visit_mask or 0) & flag]
+
+    @classmethod
+    def offers(cls, mode):
+        """WHERE criterion for doctors offering ``mode`` (a VisitType).
+
+        Spelled as IN over the few masks that include it, so the index on
+        visit_mask can be used.
+        """
+        return cls.visit_mask.in_([mask for mask in VISIT_MODES.values() if mask & mode])
+
+    def to_dict(self):
+        return {'id': self.id, 'name': self.name, 'degree': self.degree,
+                'specialization': self.specialization, 'bio': self.bio, 'fees': self.fees,
+                'rating': self.rating, 'rating_count': self.rating_count,
+                'location': self.location, 'verified': self.verified,
+                'visit_types': self.visit_types, 'visit_mask': self.visit_mask,
+                'created_at': self.created_at.isoformat() if self.created_at else None,
+                'updated_at': self.updated_at.isoformat() if self.updated_at else None}
 
 class Appointment(db.Model):
     __tablename__ = 'appointments'
     id = db.Column(db.Integer, primary_key=True)
-    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
-    patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id', name='fk_appointments_doctor_id_doctors',
+                                                    ondelete='CASCADE'), nullable=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('users.id', name='fk_appointments_patient_id_users',
+                                                     ondelete='CASCADE'), nullable=False)
     date = db.Column(db.Date, nullable=False)
     time = db.Column(db.Time, nullable=False)
     visit_type = db.Column(db.String(20), default='clinic')  # online/clinic
@@ -64,17 +115,147 @@ class Appointment(db.Model):
     doctor_response = db.Column(db.String(20))  # accept/decline
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    doctor = db.relationship('Doctor', back_populates='appointments')
-    patient = db.relationship('User', back_populates='appointments')
+    # selectin: one batched query per result set instead of one per row
+    doctor = db.relationship('Doctor', back_populates='appointments', lazy='selectin')
+    patient = db.relationship('User', back_populates='appointments', lazy='selectin')
+    reservation = db.relationship('SlotReservation', back_populates='appointment', uselist=False,
+                                  cascade='all, delete-orphan', passive_deletes=True)
+    archived = False
+
+    __table_args__ = (
+        db.Index('ix_appointments_doctor_date_time', 'doctor_id', 'date', 'time'),
+        # Ids are never reused (SQLite would hand out max(id) + 1 again), so an id
+        # stays unique across the hot table and appointments_archive
+        {'sqlite_autoincrement': True},
+    )
+
+class ArchivedAppointment(db.Model):
+    # Cold tier: past and cancelled appointments moved out by `flask archive-appointments`
+    # (see archive.py); rows keep their original id and are read-only
+    __tablename__ = 'appointments_archive'
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id', name='fk_appointments_archive_doctor_id_doctors',
+                                                    ondelete='CASCADE'), nullable=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('users.id', name='fk_appointments_archive_patient_id_users',
+                                                     ondelete='CASCADE'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    time = db.Column(db.Time, nullable=False)
+    visit_type = db.Column(db.String(20))
+    notes = db.Column(db.Text)
+    status = db.Column(db.String(20), nullable=False)
+    reschedule_count = db.Column(db.Integer, default=0)
+    doctor_response = db.Column(db.String(20))
+    created_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    doctor = db.relationship('Doctor', lazy='selectin')
+    patient = db.relationship('User', lazy='selectin')
+    archived = True
+
+    __table_args__ = (
+        db.Index('ix_appointments_archive_patient_date_time', 'patient_id', 'date', 'time'),
+        db.Index('ix_appointments_archive_doctor_date_time', 'doctor_id', 'date', 'time'),
+    )
+
+class AppointmentRollup(db.Model):
+    # Per doctor and appointment date counts over both tiers, kept current by the
+    # Appointment mapper hooks in rollups.py; the admin analytics read only this table
+    __tablename__ = 'appointment_rollups'
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id', name='fk_appointment_rollups_doctor_id_doctors',
+                                                    ondelete='CASCADE'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    appointments = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    accepted = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    declined = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    cancelled = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # by the patient
+    reschedules = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    __table_args__ = (
+        db.Index('ix_appointment_rollups_date', 'date'),
+    )
+
+class SlotReservation(db.Model):
+    # One row per active (doctor, date, time) slot; the unique key is the booking lock
+    __tablename__ = 'slot_reservations'
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id', name='fk_slot_reservations_doctor_id_doctors',
+                                                    ondelete='CASCADE'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    time = db.Column(db.Time, nullable=False)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id',
+                                                         name='fk_slot_reservations_appointment_id_appointments',
+                                                         ondelete='CASCADE'), unique=True, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    appointment = db.relationship('Appointment', back_populates='reservation')
+
+    __table_args__ = (
+        db.UniqueConstraint('doctor_id', 'date', 'time', name='uq_slot_reservations_doctor_date_time'),
+    )
+
+class AppointmentEvent(db.Model):
+    # Append-only change feed; the id is the sequence number live clients resume from
+    __tablename__ = 'appointment_events'
+    id = db.Column(db.Integer, primary_key=True)
+    appointment_id = db.Column(db.Integer, db.ForeignKey('appointments.id',
+                                                         name='fk_appointment_events_appointment_id_appointments',
+                                                         ondelete='CASCADE'), nullable=False)
+    # Copied from the appointment so subscribers can be matched without a join
+    doctor_id = db.Column(db.Integer, nullable=False)
+    patient_id = db.Column(db.Integer, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)  # booked/cancelled/rescheduled/accepted/declined
+    status = db.Column(db.String(20), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    time = db.Column(db.Time, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_appointment_events_doctor_id_id', 'doctor_id', 'id'),
+        db.Index('ix_appointment_events_patient_id_id', 'patient_id', 'id'),
+    )
+
+class OutboxMessage(db.Model):
+    # Email written in the same transaction as the change it reports; sent by `flask send-mail`
+    __tablename__ = 'outbox_messages'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending/sent/failed
+    attempts = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_outbox_messages_status_next_attempt_at', 'status', 'next_attempt_at'),
+    )
+
+class ImportCheckpoint(db.Model):
+    # Rows of an input file already imported by `flask import-doctors`, written in the
+    # same transaction as each batch; keyed by the SHA-1 of the file's absolute path
+    __tablename__ = 'import_checkpoints'
+    source = db.Column(db.String(40), primary_key=True)
+    path = db.Column(db.Text, nullable=False)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class Feedback(db.Model):
     __tablename__ = 'feedbacks'
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id', name='fk_feedbacks_user_id_users', ondelete='CASCADE'),
+                        nullable=False)
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctors.id', name='fk_feedbacks_doctor_id_doctors',
+                                                    ondelete='CASCADE'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)  # 1-5
     comment = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    user = db.relationship('User', back_populates='feedbacks')
-    doctor = db.relationship('Doctor', back_populates='feedbacks')
+    user = db.relationship('User', back_populates='feedbacks', lazy='selectin')
+    doctor = db.relationship('Doctor', back_populates='feedbacks', lazy='selectin')
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'doctor_id', name='uq_feedbacks_user_doctor'),
+    )
@@ -0,0 +1,207 @@
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from models import db, Doctor, SlotReservation
+from availability import slot_index
+
+
+class OccupancyMatrix:
+    """Doctors x slots free/booked matrix for a rolling window of days.
+
+    Each row is a doctor, each column a slot in the window (day-major). ``open``
+    holds the compiled weekly schedule and ``booked`` the reserved slots, so
+    "who is free at D/T" and the fee/rating/city/specialization filters are all
+    vectorized array operations instead of one appointment query per doctor.
+
+    Committed SlotReservation inserts, moves and deletes are applied in place
+    through session events. Doctor changes and bulk deletes mark the matrix
+    stale; it is rebuilt on the next query, when the window rolls over, or
+    after ``max_age`` seconds (which also picks up other workers' bookings).
+    """
+
+    def __init__(self, engine, window_days=14, max_age=300):
+        self.engine = engine
+        self.window_days = window_days
+        self.max_age = max_age
+        self.slots_per_day = 24 * 60 // engine.slot_minutes
+        self.built_at = None
+        self.start = None
+        self._lock = threading.RLock()
+
+    # --- Building ---
+    def rebuild(self, now=None):
+        now = now or self.engine.now()
+        rows = (db.session.query(Doctor.id, Doctor.availability, Doctor.fees, Doctor.rating,
+                                 Doctor.verified, Doctor.specialization, Doctor.location, Doctor.visit_mask)
+                .order_by(Doctor.id).all())
+        start = now.date()
+        n, spd = len(rows), self.slots_per_day
+        ids = np.fromiter((r.id for r in rows), dtype=np.int64, count=n)
+        open_ = np.zeros((n, self.window_days * spd), dtype=bool)
+        # Most doctors share a handful of schedules: expand each one once
+        by_schedule = {}
+        for i, row in enumerate(rows):
+            by_schedule.setdefault(self.engine.schedule(row), []).append(i)
+        weekdays = [(start + timedelta(days=d)).weekday() for d in range(self.window_days)]
+        for bitmaps, members in by_schedule.items():
+            pattern = np.array([bitmaps[w] >> s & 1 for w in weekdays for s in range(spd)], dtype=bool)
+            open_[members] = pattern
+        spec_codes, spec_vocab = self._encode(r.specialization for r in rows)
+        city_codes, city_vocab = self._encode(r.location for r in rows)
+        with self._lock:
+            self.start = start
+            self.ids = ids
+            self.row_of = {int(doc_id): i for i, doc_id in enumerate(ids)}
+            self.open = open_
+            self.booked = np.zeros_like(open_)
+            self.fees = np.array([r.fees or 0.0 for r in rows], dtype=float)
+            self.rating = np.array([r.rating or 0.0 for r in rows], dtype=float)
+            self.verified = np.array([bool(r.verified) for r in rows], dtype=bool)
+            self.visits = np.array([r.visit_mask or 0 for r in rows], dtype=np.int8)
+            self.spec_codes, self.spec_vocab = spec_codes, spec_vocab
+            self.city_codes, self.city_vocab = city_codes, city_vocab
+            end = start + timedelta(days=self.window_days - 1)
+            reserved = (db.session.query(SlotReservation.doctor_id, SlotReservation.date, SlotReservation.time)
+                        .filter(SlotReservation.date >= start, SlotReservation.date <= end))
+            for doctor_id, day, t in reserved:
+                self._set(doctor_id, day, t, True)
+            self.built_at = time.monotonic()
+
+    @staticmethod
+    def _encode(values):
+        vocab = {}
+        codes = [vocab.setdefault((v or '').lower(), len(vocab)) for v in values]
+        return np.array(codes, dtype=np.int32), vocab
+
+    def invalidate(self):
+        with self._lock:
+            self.built_at = None
+
+    def ensure_fresh(self, now=None):
+        now = now or self.engine.now()
+        if self.built_at is None or self.start != now.date() or time.monotonic() - self.built_at > self.max_age:
+            self.rebuild(now)
+
+    # --- Incremental updates ---
+    def _column(self, day, t):
+        if self.start is None:
+            return None
+        offset = (day - self.start).days
+        index = slot_index(t, self.engine.slot_minutes)
+        if index is None or not 0 <= offset < self.window_days:
+            return None
+        return offset * self.slots_per_day + index
+
+    def _set(self, doctor_id, day, t, booked):
+        row = self.row_of.get(doctor_id)
+        col = self._column(day, t)
+        if row is not None and col is not None:
+            self.booked[row, col] = booked
+
+    def apply(self, changes):
+        """Apply committed (doctor_id, date, time, booked) reservation changes."""
+        with self._lock:
+            if self.built_at is None:
+                return
+            for doctor_id, day, t, booked in changes:
+                self._set(doctor_id, day, t, booked)
+
+    def set_rating(self, doctor_id, rating):
+        with self._lock:
+            row = self.row_of.get(doctor_id) if self.built_at is not None else None
+            if row is not None:
+                self.rating[row] = rating or 0.0
+
+    # --- Querying ---
+    def _matching(self, vocab, codes, text):
+        text = text.lower()
+        wanted = [code for value, code in vocab.items() if text in value]
+        return np.isin(codes, wanted)
+
+    def free_doctors(self, day, t=None, specialization=None, city=None, max_fees=None,
+                     min_rating=None, visit=None, ids=None, limit=50, offset=0, now=None):
+        """Doctors free on ``day`` (at ``t`` if given), best rated and cheapest first.
+
+        ``ids`` optionally restricts the candidates. Returns ``(pairs, total)``
+        where pairs are (doctor_id, first free datetime) for the requested page.
+        """
+        now = now or self.engine.now()
+        self.ensure_fresh(now)
+        with self._lock:
+            day_index = (day - self.start).days
+            if not 0 <= day_index < self.window_days:
+                raise ValueError(f'date must be within the next {self.window_days} days')
+            spd = self.slots_per_day
+            columns = slice(day_index * spd, (day_index + 1) * spd)
+            free = self.open[:, columns] & ~self.booked[:, columns]
+            if day_index == 0:
+                elapsed = now.hour * 60 + now.minute
+                free[:, :elapsed // self.engine.slot_minutes + 1] = False
+            if t is not None:
+                index = (t.hour * 60 + t.minute) // self.engine.slot_minutes
+                mask = free[:, index].copy()
+                first = np.full(len(self.ids), index)
+            else:
+                mask = free.any(axis=1)
+                first = free.argmax(axis=1)
+            mask &= self.verified
+            if specialization:
+                mask &= self._matching(self.spec_vocab, self.spec_codes, specialization)
+            if city:
+                mask &= self._matching(self.city_vocab, self.city_codes, city)
+            if visit:
+                mask &= (self.visits & int(visit)) != 0
+            if max_fees is not None:
+                mask &= self.fees <= max_fees
+            if min_rating is not None:
+                mask &= self.rating >= min_rating
+            if ids is not None:
+                mask &= np.isin(self.ids, np.fromiter(ids, dtype=np.int64))
+            rows = np.flatnonzero(mask)
+            # Rating descending, then fees ascending, then id for a stable order
+            order = np.lexsort((self.ids[rows], self.fees[rows], -self.rating[rows]))[offset:offset + limit]
+            page = rows[order]
+            minutes = first[page] * self.engine.slot_minutes
+            midnight = datetime.combine(day, datetime.min.time())
+            return ([(int(self.ids[r]), midnight + timedelta(minutes=int(m))) for r, m in zip(page, minutes)],
+                    len(rows))
+
+    # --- Session hooks ---
+    def watch(self):
+        """Feed committed SlotReservation changes into the matrix."""
+
+        def record(target, booked, day=None, t=None):
+            session = object_session(target)
+            if session is not None:
+                session.info.setdefault('occupancy_changes', []).append(
+                    (target.doctor_id, day or target.date, t or target.time, booked))
+
+        # Mapper events also see reservations removed as delete-orphans
+        @event.listens_for(SlotReservation, 'after_insert')
+        def inserted(mapper, connection, target):
+            record(target, True)
+
+        @event.listens_for(SlotReservation, 'after_delete')
+        def deleted(mapper, connection, target):
+            record(target, False)
+
+        @event.listens_for(SlotReservation, 'after_update')
+        def moved(mapper, connection, target):
+            attrs = inspect(target).attrs
+            old_date = attrs.date.history.deleted
+            old_time = attrs.time.history.deleted
+            record(target, False, old_date[0] if old_date else None, old_time[0] if old_time else None)
+            record(target, True)
+
+        @event.listens_for(Session, 'after_commit')
+        def apply(session):
+            changes = session.info.pop('occupancy_changes', None)
+            if changes:
+                self.apply(changes)
+
+        @event.listens_for(Session, 'after_rollback')
+        def discard(session):
+            session.info.pop('occupancy_changes', None)
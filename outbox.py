@@ -0,0 +1,233 @@
+import random
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from flask_mail import Message
+from sqlalchemy import func, select, update
+from models import db, User, Doctor, OutboxMessage
+
+MESSAGES = {
+    'booked': ('Appointment requested',
+               'Hello {patient},\n\nYour appointment with {doctor} on {date} at {time} has been requested.\n'
+               'We will email you again once the doctor responds.\n'),
+    'booked_doctor': ('New appointment request',
+                      'Hello {doctor},\n\n{patient} has requested an appointment on {date} at {time}.\n'
+                      'Please accept or decline it from your dashboard.\n'),
+    'rescheduled': ('Appointment rescheduled',
+                    'Hello {patient},\n\nYour appointment with {doctor} has moved to {date} at {time}.\n'
+                    'It is waiting for the doctor to confirm the new time.\n'),
+    'rescheduled_doctor': ('Appointment rescheduled',
+                           'Hello {doctor},\n\n{patient} has moved their appointment to {date} at {time}.\n'
+                           'Please accept or decline it from your dashboard.\n'),
+    'accepted': ('Appointment confirmed',
+                 'Hello {patient},\n\n{doctor} has confirmed your appointment on {date} at {time}.\n'),
+    'declined': ('Appointment declined',
+                 'Hello {patient},\n\n{doctor} cannot see you on {date} at {time}.\n'
+                 'Please book another time.\n'),
+    'doctor_approved': ('Your doctor profile is approved',
+                        'Hello {doctor},\n\nYour profile has been verified and now appears in the clinic directory.\n'),
+}
+
+# Appointment change -> (message to the patient, message to the doctor or None)
+APPOINTMENT_MESSAGES = {
+    'booked': ('booked', 'booked_doctor'),
+    'rescheduled': ('rescheduled', 'rescheduled_doctor'),
+    'accepted': ('accepted', None),
+    'declined': ('declined', None),
+}
+
+
+def queue_mail(kind, recipient, **context):
+    """Add an email to the outbox; it is sent only if the caller's transaction commits."""
+    subject, body = MESSAGES[kind]
+    db.session.add(OutboxMessage(kind=kind, recipient=recipient, subject=subject, body=body.format(**context)))
+
+
+def notify_appointment(appt, change):
+    patient_kind, doctor_kind = APPOINTMENT_MESSAGES[change]
+    context = {'patient': appt.patient.username, 'doctor': appt.doctor.name,
+               'date': appt.date.strftime('%Y-%m-%d'), 'time': appt.time.strftime('%H:%M')}
+    if appt.patient.email:
+        queue_mail(patient_kind, appt.patient.email, **context)
+    login = appt.doctor.user
+    if doctor_kind and login is not None and login.email:
+        queue_mail(doctor_kind, login.email, **context)
+
+
+def notify_doctors_approved(doctor_ids):
+    rows = db.session.execute(select(Doctor.name, User.email).join(User, Doctor.user_id == User.id)
+                              .where(Doctor.id.in_(doctor_ids), User.email.is_not(None))).all()
+    for row in rows:
+        queue_mail('doctor_approved', row.email, doctor=row.name)
+
+
+def outbox_counts():
+    return dict(db.session.execute(select(OutboxMessage.status, func.count())
+                                   .group_by(OutboxMessage.status)).all())
+
+
+class MailWorker:
+    """Drains the outbox in batches over a small pool of long-lived SMTP connections.
+
+    Claiming a batch pushes its next_attempt_at ``lease`` seconds ahead, so
+    messages held by a worker that dies are picked up again later instead of
+    lost, and several workers can run side by side (rows are claimed with
+    SKIP LOCKED where the database has it). Failed sends are retried with
+    exponential backoff until ``max_attempts``; rejected recipients fail at once.
+    """
+
+    def __init__(self, app, mail, batch_size=100, connections=2, max_attempts=8,
+                 retry_seconds=30, retry_max_seconds=3600, lease=300):
+        self.app = app
+        self.mail = mail
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_seconds = retry_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.lease = lease
+        self.connections = connections
+        self._pool = ThreadPoolExecutor(connections, thread_name_prefix='smtp')
+        self._local = threading.local()
+        self._open = []
+        self._lock = threading.Lock()
+
+    def run(self, interval=5, once=False, echo=None):
+        """Send until the outbox is empty, then (unless ``once``) poll every ``interval`` seconds."""
+        try:
+            while True:
+                with self.app.app_context():
+                    sent, failed = self.drain()
+                if echo and (sent or failed):
+                    echo(f'Sent {sent} emails, {failed} failed.')
+                if once:
+                    return
+                time.sleep(interval)
+        finally:
+            self.close()
+
+    def drain(self):
+        sent = failed = 0
+        while True:
+            batch = self.claim()
+            if not batch:
+                return sent, failed
+            ok, errors = self.send(batch)
+            self.record(batch, ok, errors)
+            sent += len(ok)
+            failed += len(errors)
+
+    def claim(self):
+        now = datetime.utcnow()
+        batch = db.session.execute(
+            select(OutboxMessage.id, OutboxMessage.recipient, OutboxMessage.subject, OutboxMessage.body,
+                   OutboxMessage.attempts)
+            .where(OutboxMessage.status == 'pending', OutboxMessage.next_attempt_at <= now)
+            .order_by(OutboxMessage.id).limit(self.batch_size).with_for_update(skip_locked=True)).all()
+        if batch:
+            db.session.execute(update(OutboxMessage).where(OutboxMessage.id.in_([row.id for row in batch]))
+                               .values(next_attempt_at=now + timedelta(seconds=self.lease)))
+        db.session.commit()
+        return batch
+
+    def send(self, batch):
+        """Send ``batch`` spread over the connections; returns sent ids and {id: (permanent, error)}."""
+        shares = [batch[i::self.connections] for i in range(self.connections)]
+        ok, errors = [], {}
+        for sent, failed in self._pool.map(self._send_share, [share for share in shares if share]):
+            ok += sent
+            errors.update(failed)
+        return ok, errors
+
+    def record(self, batch, ok, errors):
+        now = datetime.utcnow()
+        if ok:
+            db.session.execute(update(OutboxMessage).where(OutboxMessage.id.in_(ok))
+                               .values(status='sent', sent_at=now, attempts=OutboxMessage.attempts + 1,
+                                       last_error=None))
+        attempts = {row.id: row.attempts + 1 for row in batch}
+        for message_id, (permanent, error) in errors.items():
+            values = {'attempts': attempts[message_id], 'last_error': error[:1000]}
+            if permanent or attempts[message_id] >= self.max_attempts:
+                values['status'] = 'failed'
+            else:
+                values['next_attempt_at'] = now + timedelta(seconds=self.backoff(attempts[message_id]))
+            db.session.execute(update(OutboxMessage).where(OutboxMessage.id == message_id).values(**values))
+        db.session.commit()
+
+    def backoff(self, attempts):
+        # Jittered so a burst that failed together does not retry together
+        delay = min(self.retry_max_seconds, self.retry_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        with self._lock:
+            connections, self._open = self._open, []
+        for connection in connections:
+            try:
+                connection.__exit__(None, None, None)
+            except (smtplib.SMTPException, OSError):
+                pass
+
+    # --- Runs on the pool threads ---
+    def _send_share(self, share):
+        sent, failed = [], {}
+        with self.app.app_context():
+            for row in share:
+                try:
+                    error = self._send_one(row)
+                except (smtplib.SMTPException, OSError) as e:
+                    # No connection to the server: the rest of the share waits for its lease to run out
+                    self.app.logger.warning('SMTP connect failed: %s', e)
+                    failed[row.id] = (False, str(e) or e.__class__.__name__)
+                    break
+                if error is None:
+                    sent.append(row.id)
+                else:
+                    failed[row.id] = error
+        return sent, failed
+
+    def _send_one(self, row):
+        """Send one message; returns None, or (permanent, error) if it could not be sent."""
+        message = Message(subject=row.subject, recipients=[row.recipient], body=row.body)
+        for retry in (False, True):
+            connection = self._connection()
+            try:
+                connection.send(message)
+                return None
+            except smtplib.SMTPRecipientsRefused as e:
+                return True, str(e.recipients)
+            except smtplib.SMTPDataError as e:
+                return e.smtp_code >= 500, f'{e.smtp_code} {e.smtp_error!r}'
+            except smtplib.SMTPServerDisconnected as e:
+                # Servers drop idle connections; reconnect once before counting a failure
+                self._drop_connection()
+                if retry:
+                    return False, str(e) or 'server disconnected'
+            except (smtplib.SMTPException, OSError) as e:
+                self._drop_connection()
+                return False, str(e) or e.__class__.__name__
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self.mail.connect().__enter__()
+            self._local.connection = connection
+            with self._lock:
+                self._open.append(connection)
+        return connection
+
+    def _drop_connection(self):
+        connection = getattr(self._local, 'connection', None)
+        self._local.connection = None
+        if connection is None:
+            return
+        with self._lock:
+            if connection in self._open:
+                self._open.remove(connection)
+        try:
+            connection.__exit__(None, None, None)
+        except (smtplib.SMTPException, OSError):
+            pass
@@ -0,0 +1,108 @@
+import base64
+import json
+from datetime import date, datetime, time
+from flask import request, url_for, current_app
+from sqlalchemy import and_, or_
+
+
+class Page:
+    """One keyset page of results plus the cursors needed to move around it."""
+
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['items'], next_cursor=data['next'], prev_cursor=data['prev'])
+
+    def to_dict(self, serialize):
+        return {'items': [serialize(item) for item in self.items],
+                'next': self.next_cursor, 'prev': self.prev_cursor}
+
+
+ISO_TYPES = (date, datetime, time)
+
+
+def encode_cursor(values):
+    raw = json.dumps([v.isoformat() if isinstance(v, ISO_TYPES) else v for v in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, keys):
+    """Turn a cursor back into column values; bad or stale cursors give None."""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(raw)
+        if len(values) != len(keys):
+            return None
+        types = [key.type.python_type for key in keys]
+        return [t.fromisoformat(v) if t in ISO_TYPES else t(v) for t, v in zip(types, values)]
+    except (ValueError, TypeError):
+        return None
+
+
+def _after(keys, values, less):
+    # Row-value comparison (a, b) < (x, y) spelled out portably
+    clauses = []
+    for i, key in enumerate(keys):
+        prefix = [keys[j] == values[j] for j in range(i)]
+        clauses.append(and_(*prefix, key < values[i] if less else key > values[i]))
+    return or_(*clauses)
+
+
+def page_size(prefix=''):
+    default = current_app.config['PAGE_SIZE']
+    size = request.args.get(prefix + 'per_page', default, type=int)
+    return max(1, min(size, current_app.config['MAX_PAGE_SIZE']))
+
+
+def paginate(query, keys, descending=False, prefix=''):
+    """Keyset-paginate query on keys, reading cursors from the request args.
+
+    ``after`` moves forward in display order, ``before`` moves back. Each page
+    is a single indexed range scan no matter how deep the cursor is.
+    """
+    per_page = page_size(prefix)
+    before = decode_cursor(request.args.get(prefix + 'before'), keys)
+    after = None if before else decode_cursor(request.args.get(prefix + 'after'), keys)
+    forward = before is None
+    less = descending if forward else not descending
+    cursor = after if forward else before
+    if cursor:
+        query = query.filter(_after(keys, cursor, less))
+    query = query.order_by(*[k.desc() if less else k.asc() for k in keys])
+    rows = query.limit(per_page + 1).all()
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+    if not rows:
+        return Page(rows)
+    first = encode_cursor([getattr(rows[0], k.key) for k in keys])
+    last = encode_cursor([getattr(rows[-1], k.key) for k in keys])
+    if forward:
+        return Page(rows, next_cursor=last if more else None, prev_cursor=first if cursor else None)
+    return Page(rows, next_cursor=last, prev_cursor=first if more else None)
+
+
+def pager_url(cursor, direction, prefix=''):
+    """URL for the current view with only this pager's cursor replaced."""
+    args = request.args.to_dict()
+    args.pop(prefix + 'after', None)
+    args.pop(prefix + 'before', None)
+    args[prefix + direction] = cursor
+    return url_for(request.endpoint, **(request.view_args or {}), **args)
+
+
+def wants_json():
+    return request.args.get('format') == 'json'
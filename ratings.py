@@ -0,0 +1,76 @@
+from sqlalchemy import case, func, select, update
+from models import db, Doctor, Feedback
+
+
+def _average(rating_sum, rating_count):
+    return case((rating_count > 0, rating_sum * 1.0 / rating_count), else_=0.0)
+
+
+def apply_feedback(doctor_id, delta_sum, delta_count):
+    """Adjust one doctor's rating aggregate in a single atomic UPDATE.
+
+    ``rating`` is assigned first: MySQL evaluates SET left to right, so this
+    order makes it read the pre-update sum/count on every backend.
+    """
+    new_sum = Doctor.rating_sum + delta_sum
+    new_count = Doctor.rating_count + delta_count
+    stmt = (update(Doctor).where(Doctor.id == doctor_id)
+            .ordered_values((Doctor.rating, _average(new_sum, new_count)),
+                            (Doctor.rating_sum, new_sum),
+                            (Doctor.rating_count, new_count))
+            .execution_options(synchronize_session=False))
+    db.session.execute(stmt)
+
+
+def add_feedback(feedback):
+    """Insert feedback and count it in a savepoint.
+
+    Raises IntegrityError, leaving the session usable, when the patient has
+    already rated this doctor.
+    """
+    with db.session.begin_nested():
+        db.session.add(feedback)
+        db.session.flush()
+        apply_feedback(feedback.doctor_id, feedback.rating, 1)
+
+
+def change_feedback(feedback, rating):
+    # Lock the row and re-read its rating so concurrent edits each subtract what they replace
+    db.session.refresh(feedback, with_for_update=True)
+    apply_feedback(feedback.doctor_id, rating - feedback.rating, 0)
+    feedback.rating = rating
+
+
+def remove_feedback(feedback):
+    # Callers load the row with_for_update(), so a concurrent delete finds nothing to subtract
+    apply_feedback(feedback.doctor_id, -feedback.rating, -1)
+    db.session.delete(feedback)
+
+
+def recompute_ratings(doctor_ids=None, chunk_size=1000):
+    """Rebuild aggregates from the feedbacks table, chunked by doctor id.
+
+    Returns the number of doctors updated. Used for backfills and after bulk
+    feedback deletes that bypass the per-row helpers.
+    """
+    rating_sum = (select(func.coalesce(func.sum(Feedback.rating), 0))
+                  .where(Feedback.doctor_id == Doctor.id).scalar_subquery())
+    rating_count = (select(func.count(Feedback.id))
+                    .where(Feedback.doctor_id == Doctor.id).scalar_subquery())
+    updated = 0
+    last_id = 0
+    while True:
+        query = db.session.query(Doctor.id).filter(Doctor.id > last_id)
+        if doctor_ids is not None:
+            query = query.filter(Doctor.id.in_(doctor_ids))
+        ids = [row.id for row in query.order_by(Doctor.id).limit(chunk_size)]
+        if not ids:
+            return updated
+        db.session.execute(
+            update(Doctor).where(Doctor.id.in_(ids))
+            .values(rating_sum=rating_sum, rating_count=rating_count,
+                    rating=_average(rating_sum, rating_count))
+            .execution_options(synchronize_session=False))
+        db.session.commit()
+        updated += len(ids)
+        last_id = ids[-1]
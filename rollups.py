@@ -0,0 +1,158 @@
+from sqlalchemy import and_, case, delete, event, func, inspect, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from archive import history
+from models import db, Appointment, AppointmentRollup, Doctor
+
+COUNTERS = ('appointments', 'accepted', 'declined', 'cancelled', 'reschedules')
+# Appointment attributes a rollup row depends on, in counts() order after the key
+TRACKED = ('doctor_id', 'date', 'status', 'doctor_response', 'reschedule_count')
+
+
+def counts(status, doctor_response, reschedule_count):
+    """What one appointment in this state adds to its (doctor, date) row.
+
+    A decline also sets the status to cancelled; it is counted as declined
+    only, so ``cancelled`` means cancelled by the patient.
+    """
+    return {'appointments': 1,
+            'accepted': int(doctor_response == 'accept'),
+            'declined': int(doctor_response == 'decline'),
+            'cancelled': int(status == 'cancelled' and doctor_response != 'decline'),
+            'reschedules': reschedule_count or 0}
+
+
+def _aggregates(rows):
+    # counts() summed in SQL, for the rebuild
+    response = func.coalesce(rows.c.doctor_response, '')
+    return (func.count().label('appointments'),
+            func.sum(case((response == 'accept', 1), else_=0)).label('accepted'),
+            func.sum(case((response == 'decline', 1), else_=0)).label('declined'),
+            func.sum(case((and_(rows.c.status == 'cancelled', response != 'decline'), 1), else_=0)).label('cancelled'),
+            func.coalesce(func.sum(rows.c.reschedule_count), 0).label('reschedules'))
+
+
+# --- Incremental maintenance ---
+def _state(target, old=False):
+    attrs = inspect(target).attrs
+    values = []
+    for key in TRACKED:
+        deleted = attrs[key].history.deleted if old else None
+        values.append(deleted[0] if deleted else getattr(target, key))
+    return tuple(values)
+
+
+def _deltas(old, new):
+    """{(doctor_id, date): counter deltas} for one appointment going from ``old`` to ``new``."""
+    rows = {}
+    for state, sign in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        doctor_id, day, *rest = state
+        row = rows.setdefault((doctor_id, day), dict.fromkeys(COUNTERS, 0))
+        for counter, value in counts(*rest).items():
+            row[counter] += sign * value
+    return rows
+
+
+def apply_deltas(connection, rows):
+    """Add deltas to rollup rows with one atomic UPDATE each, inserting rows not there yet.
+
+    A row whose last appointment moved away or was deleted is removed, as a
+    rebuild would never produce it.
+    """
+    table = AppointmentRollup.__table__
+    for (doctor_id, day), deltas in rows.items():
+        deltas = {counter: value for counter, value in deltas.items() if value}
+        if not deltas:
+            continue
+        key = (table.c.doctor_id == doctor_id, table.c.date == day)
+        stmt = (update(table).where(*key)
+                .values({table.c[counter]: table.c[counter] + value for counter, value in deltas.items()}))
+        if connection.execute(stmt).rowcount:
+            if deltas.get('appointments', 0) < 0:
+                connection.execute(delete(table).where(*key, table.c.appointments == 0))
+            continue
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(table).values(doctor_id=doctor_id, date=day,
+                                                        **dict(dict.fromkeys(COUNTERS, 0), **deltas)))
+        except IntegrityError:
+            # Another transaction inserted the row first
+            connection.execute(stmt)
+
+
+def watch():
+    """Keep appointment_rollups current from ORM writes to appointments, in the writing transaction.
+
+    Core bulk deletes (bulk.py) bypass these hooks and rebuild the doctors
+    they touched instead; archiving moves rows between tiers that the
+    rollups already both count, so it needs neither.
+    """
+
+    @event.listens_for(Appointment, 'after_insert')
+    def inserted(mapper, connection, target):
+        apply_deltas(connection, _deltas(None, _state(target)))
+
+    @event.listens_for(Appointment, 'after_update')
+    def updated(mapper, connection, target):
+        old, new = _state(target, old=True), _state(target)
+        if old != new:
+            apply_deltas(connection, _deltas(old, new))
+
+    @event.listens_for(Appointment, 'after_delete')
+    def deleted(mapper, connection, target):
+        apply_deltas(connection, _deltas(_state(target, old=True), None))
+
+
+# --- Rebuild ---
+def rebuild_rollups(doctor_ids=None, chunk_size=500):
+    """Recompute rollups from both appointment tiers, one transaction per chunk of doctors.
+
+    Returns the number of doctors processed.
+    """
+    done = 0
+    last_id = 0
+    while True:
+        query = select(Doctor.id).where(Doctor.id > last_id)
+        if doctor_ids is not None:
+            query = query.where(Doctor.id.in_(doctor_ids))
+        ids = db.session.scalars(query.order_by(Doctor.id).limit(chunk_size)).all()
+        if not ids:
+            return done
+        rows = history(lambda model: select(*[getattr(model, key) for key in TRACKED])
+                       .where(model.doctor_id.in_(ids)))
+        db.session.execute(delete(AppointmentRollup).where(AppointmentRollup.doctor_id.in_(ids)))
+        db.session.execute(insert(AppointmentRollup).from_select(
+            ('doctor_id', 'date') + COUNTERS,
+            select(rows.c.doctor_id, rows.c.date, *_aggregates(rows)).group_by(rows.c.doctor_id, rows.c.date)))
+        db.session.commit()
+        done += len(ids)
+        last_id = ids[-1]
+
+
+# --- Reading ---
+def _with_rates(row):
+    total = row['appointments']
+    return dict(row, decline_rate=round(row['declined'] / total, 4) if total else 0.0,
+                cancel_rate=round(row['cancelled'] / total, 4) if total else 0.0)
+
+
+def summary(start, end, doctor_id=None, top=50):
+    """Totals, a per-day series and the busiest ``top`` doctors for appointment dates in [start, end].
+
+    Reads appointment_rollups only (plus doctor names for the top list).
+    """
+    r = AppointmentRollup
+    criteria = [r.date >= start, r.date <= end]
+    if doctor_id is not None:
+        criteria.append(r.doctor_id == doctor_id)
+    sums = [func.coalesce(func.sum(getattr(r, counter)), 0).label(counter) for counter in COUNTERS]
+    totals = db.session.execute(select(*sums).where(*criteria)).one()._asdict()
+    days = db.session.execute(select(r.date, *sums).where(*criteria).group_by(r.date).order_by(r.date))
+    doctors = db.session.execute(
+        select(r.doctor_id, Doctor.name, *sums).join(Doctor, Doctor.id == r.doctor_id).where(*criteria)
+        .group_by(r.doctor_id, Doctor.name).order_by(func.sum(r.appointments).desc(), r.doctor_id).limit(top))
+    return {'start': start.isoformat(), 'end': end.isoformat(), 'doctor_id': doctor_id,
+            'totals': _with_rates(totals),
+            'days': [_with_rates(dict(row._asdict(), date=row.date.isoformat())) for row in days],
+            'doctors': [_with_rates(row._asdict()) for row in doctors]}
@@ -0,0 +1,164 @@
+import itertools
+import threading
+import time
+from functools import wraps
+from flask import g, has_request_context, request, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_PREFIX = 'replica_'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaPool:
+    """Round-robin over the replica engines, skipping ones that recently failed.
+
+    A replica is probed with ``SELECT 1`` before first use and again every
+    ``check_interval`` seconds; one that fails the probe or drops a connection
+    mid-query is skipped for ``retry_after`` seconds, so reads fall back to the
+    primary instead of erroring.
+    """
+
+    def __init__(self, check_interval=10, retry_after=30):
+        self.check_interval = check_interval
+        self.retry_after = retry_after
+        self.engines = []
+        self._cycle = None
+        self._checked = {}
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def configure(self, engines):
+        self.engines = list(engines)
+        self._cycle = itertools.cycle(self.engines) if self.engines else None
+
+    def mark_down(self, engine):
+        with self._lock:
+            self._down_until[engine] = time.monotonic() + self.retry_after
+
+    def _healthy(self, engine):
+        now = time.monotonic()
+        with self._lock:
+            if self._down_until.get(engine, 0) > now:
+                return False
+            if now - self._checked.get(engine, float('-inf')) < self.check_interval:
+                return True
+            self._checked[engine] = now
+        try:
+            with engine.connect() as conn:
+                conn.exec_driver_sql('SELECT 1')
+        except Exception:
+            self.mark_down(engine)
+            return False
+        return True
+
+    def choose(self):
+        """A healthy replica engine, or None to use the primary."""
+        if self._cycle is None:
+            return None
+        with self._lock:
+            candidates = [next(self._cycle) for _ in self.engines]
+        for engine in candidates:
+            if self._healthy(engine):
+                return engine
+        return None
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [{'url': engine.url.render_as_string(hide_password=True),
+                     'down': self._down_until.get(engine, 0) > now} for engine in self.engines]
+
+
+replicas = ReplicaPool()
+
+
+class RoutingSession(Session):
+    """Session that sends plain reads made while serving a read-only request to a replica.
+
+    Flushes, DML, SELECT ... FOR UPDATE, anything outside a request and anything
+    after this session has written stay on the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info['wrote'] = True
+            elif self._can_use_replica(clause):
+                engine = replicas.choose()
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _can_use_replica(self, clause):
+        return (not self.info.get('wrote') and has_request_context() and g.get('db_read_only', False)
+                and getattr(clause, 'is_select', False) and getattr(clause, '_for_update_arg', None) is None)
+
+
+def use_primary(func):
+    """Mark a view that writes despite being reached by GET."""
+    @wraps(func)
+    def decorated(*args, **kwargs):
+        g.db_read_only = False
+        return func(*args, **kwargs)
+    return decorated
+
+
+def init_routing(app, db):
+    """Wire statement timeouts, SQLite foreign keys, replica health tracking and per-request routing."""
+    sticky = app.config['REPLICA_STICKY_SECONDS']
+    timeout_ms = app.config['DB_STATEMENT_TIMEOUT_MS']
+    replicas.check_interval = app.config['REPLICA_CHECK_SECONDS']
+    replicas.retry_after = app.config['REPLICA_RETRY_SECONDS']
+    with app.app_context():
+        engines = db.engines
+    replicas.configure(engine for key, engine in sorted(engines.items(), key=lambda kv: str(kv[0]))
+                       if key is not None and str(key).startswith(REPLICA_PREFIX))
+
+    for engine in set(engines.values()):
+        if engine.dialect.name == 'sqlite':
+            # SQLite ignores foreign keys (and so ON DELETE CASCADE) unless asked per connection
+            event.listen(engine, 'connect', _sqlite_foreign_keys)
+        if timeout_ms:
+            event.listen(engine, 'connect', _statement_timeout(engine.dialect.name, timeout_ms))
+    for engine in replicas.engines:
+        event.listen(engine, 'handle_error', _replica_error(engine))
+
+    @app.before_request
+    def route_reads():
+        # Clients that just wrote read from the primary until replicas catch up
+        g.db_read_only = (bool(replicas.engines) and request.method in SAFE_METHODS
+                          and session.get('db_primary_until', 0) < time.time())
+
+    @app.after_request
+    def stick_to_primary(response):
+        if replicas.engines and (request.method not in SAFE_METHODS or db.session().info.get('wrote')):
+            session['db_primary_until'] = time.time() + sticky
+        return response
+
+
+def _statement_timeout(dialect, timeout_ms):
+    def on_connect(dbapi_connection, connection_record):
+        if dialect == 'mysql':
+            statement = f'SET SESSION max_execution_time = {int(timeout_ms)}'
+        elif dialect == 'postgresql':
+            statement = f'SET statement_timeout = {int(timeout_ms)}'
+        else:
+            return
+        cursor = dbapi_connection.cursor()
+        cursor.execute(statement)
+        cursor.close()
+    return on_connect
+
+
+def _sqlite_foreign_keys(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA foreign_keys = ON')
+    cursor.close()
+
+
+def _replica_error(engine):
+    def on_error(context):
+        if context.is_disconnect:
+            replicas.mark_down(engine)
+    return on_error
@@ -0,0 +1,241 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from models import Doctor
+
+# Relative weight of a query term matching each indexed field
+FIELD_WEIGHTS = {'specialization': 3.0, 'name': 2.0, 'location': 2.0, 'bio': 1.0}
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+PREFIX_WEIGHT = 0.8
+FUZZY_WEIGHT = 0.6
+FUZZY_MIN_SIMILARITY = 0.4
+MAX_EXPANSIONS = 20
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower()) if text else []
+
+
+def trigrams(token):
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class DoctorSearchIndex:
+    """In-memory inverted index over doctor name, specialization, bio and location.
+
+    Query terms match exactly, by prefix ("cardio" -> "cardiology") or, failing
+    both, by trigram similarity so small typos still hit. Results are ranked by
+    relevance, then rating (high first), then fees (low first).
+
+    Routes that add, approve or delete doctors update the index in place. It is
+    also rebuilt from the database once it is older than ``max_age`` seconds,
+    which picks up writes made by other worker processes. One thread loads the
+    new snapshot while the others keep searching the previous one.
+    """
+
+    def __init__(self, max_age=300):
+        self.max_age = max_age
+        self.built_at = None
+        self._lock = threading.RLock()
+        # Held by the one thread loading a fresh snapshot; others keep serving the old one
+        self._rebuild_lock = threading.Lock()
+        self._generation = 0
+        # (doc_id, record or None) changes made while a rebuild is loading
+        self._pending = None
+        self._reset()
+
+    def _reset(self):
+        self.records = {}
+        self.postings = {field: defaultdict(set) for field in FIELD_WEIGHTS}
+        self.vocab = []
+        self.token_refs = defaultdict(int)
+        self.trigram_tokens = defaultdict(set)
+
+    # --- Maintenance ---
+    def rebuild(self):
+        with self._rebuild_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        # Load outside self._lock so searches keep running on the current snapshot
+        with self._lock:
+            generation = self._generation
+            self._pending = []
+        fresh = DoctorSearchIndex(self.max_age)
+        try:
+            for doc in Doctor.query.all():
+                fresh._add(doc.to_dict())
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+        with self._lock:
+            for doc_id, record in self._pending:
+                fresh._remove(doc_id)
+                if record is not None:
+                    fresh._add(record)
+            self._pending = None
+            for name in ('records', 'postings', 'vocab', 'token_refs', 'trigram_tokens'):
+                setattr(self, name, getattr(fresh, name))
+            # An invalidate() during the load asks for another rebuild
+            self.built_at = time.monotonic() if generation == self._generation else None
+
+    def ensure_fresh(self):
+        if self.built_at is None:
+            # Nothing current to serve: wait for a rebuild, unless one just finished
+            with self._rebuild_lock:
+                if self.built_at is None:
+                    self._rebuild()
+        elif time.monotonic() - self.built_at > self.max_age and self._rebuild_lock.acquire(blocking=False):
+            try:
+                self._rebuild()
+            finally:
+                self._rebuild_lock.release()
+
+    def invalidate(self):
+        # After bulk changes a single rebuild beats many upserts
+        with self._lock:
+            self._generation += 1
+            self.built_at = None
+
+    def upsert(self, doc):
+        record = doc.to_dict()
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((doc.id, record))
+            if self.built_at is None:
+                return
+            self._remove(doc.id)
+            self._add(record)
+
+    def remove(self, doc_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((doc_id, None))
+            self._remove(doc_id)
+
+    def get(self, doc_id):
+        return self.records.get(doc_id)
+
+    def _add(self, record):
+        self.records[record['id']] = record
+        for field in FIELD_WEIGHTS:
+            for token in set(tokenize(record.get(field))):
+                self.postings[field][token].add(record['id'])
+                self._ref(token)
+
+    def _remove(self, doc_id):
+        record = self.records.pop(doc_id, None)
+        if record is None:
+            return
+        for field in FIELD_WEIGHTS:
+            for token in set(tokenize(record.get(field))):
+                ids = self.postings[field].get(token)
+                if ids is not None:
+                    ids.discard(doc_id)
+                    if not ids:
+                        del self.postings[field][token]
+                self._unref(token)
+
+    def _ref(self, token):
+        self.token_refs[token] += 1
+        if self.token_refs[token] == 1:
+            bisect.insort(self.vocab, token)
+            for gram in trigrams(token):
+                self.trigram_tokens[gram].add(token)
+
+    def _unref(self, token):
+        self.token_refs[token] -= 1
+        if self.token_refs[token] > 0:
+            return
+        del self.token_refs[token]
+        i = bisect.bisect_left(self.vocab, token)
+        if i < len(self.vocab) and self.vocab[i] == token:
+            del self.vocab[i]
+        for gram in trigrams(token):
+            tokens = self.trigram_tokens.get(gram)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self.trigram_tokens[gram]
+
+    # --- Querying ---
+    def _expand(self, token):
+        """Vocabulary terms a query token may stand for, with a closeness weight."""
+        terms = {}
+        if token in self.token_refs:
+            terms[token] = 1.0
+        i = bisect.bisect_left(self.vocab, token)
+        while i < len(self.vocab) and len(terms) < MAX_EXPANSIONS and self.vocab[i].startswith(token):
+            terms.setdefault(self.vocab[i], PREFIX_WEIGHT)
+            i += 1
+        if terms or len(token) < 3:
+            return terms
+        grams = trigrams(token)
+        shared = defaultdict(int)
+        for gram in grams:
+            for candidate in self.trigram_tokens.get(gram, ()):
+                shared[candidate] += 1
+        for candidate, common in shared.items():
+            similarity = common / (len(grams) + len(trigrams(candidate)) - common)
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                terms[candidate] = FUZZY_WEIGHT * similarity
+        return dict(heapq.nlargest(MAX_EXPANSIONS, terms.items(), key=lambda t: t[1]))
+
+    def _match(self, token, fields):
+        scores = {}
+        total = len(self.records) or 1
+        for term, closeness in self._expand(token).items():
+            for field in fields:
+                ids = self.postings[field].get(term)
+                if not ids:
+                    continue
+                weight = FIELD_WEIGHTS[field] * closeness * math.log(1 + total / len(ids))
+                for doc_id in ids:
+                    if weight > scores.get(doc_id, 0.0):
+                        scores[doc_id] = weight
+        return scores
+
+    def _score(self, groups):
+        """AND together every token of every (text, fields) group, summing scores."""
+        combined = None
+        for text, fields in groups:
+            for token in tokenize(text):
+                scores = self._match(token, fields)
+                if combined is None:
+                    combined = scores
+                else:
+                    combined = {i: s + scores[i] for i, s in combined.items() if i in scores}
+                if not combined:
+                    return {}
+        return combined
+
+    def search(self, q=None, specialization=None, city=None, max_fees=None, min_rating=None,
+               visit=None, limit=24, offset=0, verified_only=True):
+        """Return (records, total) for the top ``limit`` matches after ``offset``.
+
+        ``visit`` keeps doctors whose visit_mask has any of its VisitType bits.
+        """
+        with self._lock:
+            groups = [(q, tuple(FIELD_WEIGHTS)), (specialization, ('specialization',)), (city, ('location',))]
+            groups = [g for g in groups if tokenize(g[0])]
+            scores = self._score(groups) if groups else dict.fromkeys(self.records, 0.0)
+            matches = []
+            for doc_id, score in scores.items():
+                record = self.records[doc_id]
+                if verified_only and not record['verified']:
+                    continue
+                if max_fees is not None and (record['fees'] or 0.0) > max_fees:
+                    continue
+                if min_rating is not None and (record['rating'] or 0.0) < min_rating:
+                    continue
+                if visit and not record['visit_mask'] & visit:
+                    continue
+                matches.append((-score, -(record['rating'] or 0.0), record['fees'] or 0.0, doc_id))
+            top = heapq.nsmallest(offset + limit, matches)[offset:]
+            return [self.records[m[3]] for m in top], len(matches)
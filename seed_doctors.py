@@ -1,6 +1,5 @@
 from app import app, db
-from models import Doctor, User, UserRole
-import json
+from models import Doctor, User, UserRole, VISIT_MODES
 
 def seed_doctors():
     with app.app_context():
@@ -24,7 +23,7 @@ def seed_doctors():
                 'fees': 1500.0,
                 'location': 'Mumbai',
                 'contact_info': 'smith@clinic.com, +91-9876543210',
-                'visit_types': json.dumps(['clinic', 'online']),
+                'visit_types': 'both',
                 'verified': True
             },
             {
@@ -40,7 +39,7 @@ def seed_doctors():
                 'fees': 1200.0,
                 'location': 'Delhi',
                 'contact_info': 'jones@clinic.com, +91-9876543211',
-                'visit_types': json.dumps(['clinic', 'online']),
+                'visit_types': 'both',
                 'verified': True
             },
             {
@@ -56,7 +55,7 @@ def seed_doctors():
                 'fees': 2000.0,
                 'location': 'Bangalore',
                 'contact_info': 'brown@clinic.com, +91-9876543212',
-                'visit_types': json.dumps(['clinic']),
+                'visit_types': 'clinic',
                 'verified': True
             },
             {
@@ -72,7 +71,7 @@ def seed_doctors():
                 'fees': 1800.0,
                 'location': 'Chennai',
                 'contact_info': 'davis@clinic.com, +91-9876543213',
-                'visit_types': json.dumps(['clinic', 'online']),
+                'visit_types': 'both',
                 'verified': True
             },
             {
@@ -88,7 +87,7 @@ def seed_doctors():
                 'fees': 1600.0,
                 'location': 'Pune',
                 'contact_info': 'wilson@clinic.com, +91-9876543214',
-                'visit_types': json.dumps(['online']),
+                'visit_types': 'online',
                 'verified': True
             }
         ]
@@ -115,7 +114,7 @@ def seed_doctors():
                 fees=doc_data['fees'],
                 location=doc_data['location'],
                 contact_info=doc_data['contact_info'],
-                visit_types=doc_data['visit_types'],
+                visit_mask=VISIT_MODES[doc_data['visit_types']],
                 verified=doc_data['verified']
             )
             db.session.add(doctor)
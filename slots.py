@@ -0,0 +1,38 @@
+from sqlalchemy.exc import IntegrityError
+from models import db, SlotReservation
+
+
+class SlotTaken(Exception):
+    """Raised when a doctor/date/time slot is already held by another appointment."""
+
+
+def reserve_slot(appt):
+    """Add a new appointment and claim its slot in a single savepoint."""
+    try:
+        with db.session.begin_nested():
+            db.session.add(appt)
+            db.session.add(SlotReservation(appointment=appt, doctor_id=appt.doctor_id,
+                                           date=appt.date, time=appt.time))
+    except IntegrityError:
+        raise SlotTaken()
+
+
+def move_slot(appt, date, time):
+    """Move an appointment (and its reservation) to a new date/time."""
+    try:
+        with db.session.begin_nested():
+            appt.date = date
+            appt.time = time
+            if appt.reservation is None:
+                appt.reservation = SlotReservation(doctor_id=appt.doctor_id, date=date, time=time)
+            else:
+                appt.reservation.date = date
+                appt.reservation.time = time
+    except IntegrityError:
+        raise SlotTaken()
+
+
+def release_slot(appt):
+    """Free the appointment's slot so it can be booked again."""
+    appt.reservation = None
+